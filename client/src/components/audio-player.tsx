@@ -85,7 +85,7 @@ export default function AudioPlayer({
     <div className="fixed bottom-0 left-0 right-0 bg-card p-4 border-t">
       <audio
         ref={audioRef}
-        src={`/api/songs/${song.id}/audio`}
+        src={song.audioUrl}
         onTimeUpdate={handleTimeUpdate}
         onEnded={onNext}
       />
@@ -1,9 +1,11 @@
 import { Playlist, Song } from "@shared/schema";
 import { Button } from "@/components/ui/button";
 import { ChevronLeft } from "lucide-react";
-import { useQuery } from "@tanstack/react-query";
 import { cn } from "@/lib/utils";
 
+// Songs as returned by /api/library, with their play count attached
+export type LibrarySong = Song & { plays: number };
+
 export default function SongList({
   playlist,
   songs,
@@ -12,7 +14,7 @@ export default function SongList({
   selectedSong,
 }: {
   playlist: Playlist;
-  songs: Song[];
+  songs: LibrarySong[];
   onBack: () => void;
   onSelect: (song: Song) => void;
   selectedSong: Song | null;
@@ -37,6 +39,7 @@ export default function SongList({
             <SongItem
               key={song.id}
               song={song}
+              playCount={song.plays}
               isSelected={selectedSong?.id === song.id}
               onClick={() => onSelect(song)}
             />
@@ -49,17 +52,15 @@ export default function SongList({
 
 function SongItem({
   song,
+  playCount,
   isSelected,
   onClick,
 }: {
   song: Song;
+  playCount: number | undefined;
   isSelected: boolean;
   onClick: () => void;
 }) {
-  const { data: playCount } = useQuery<number>({
-    queryKey: [`/api/songs/${song.id}/plays`],
-  });
-
   return (
     <div
       className={cn(
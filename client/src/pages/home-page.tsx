@@ -2,23 +2,23 @@ import { useState } from "react";
 import { useQuery } from "@tanstack/react-query";
 import { Playlist, Song } from "@shared/schema";
 import PlaylistGrid from "@/components/playlist-grid";
-import SongList from "@/components/song-list";
+import SongList, { LibrarySong } from "@/components/song-list";
 import AudioPlayer from "@/components/audio-player";
-import { getPlaylistSongs } from "../lib/queryClient";
+
+type LibraryPlaylist = Playlist & { songs: LibrarySong[] };
 
 export default function HomePage() {
-  const [selectedPlaylist, setSelectedPlaylist] = useState<Playlist | null>(null);
+  const [selectedPlaylistId, setSelectedPlaylistId] = useState<number | null>(null);
   const [selectedSong, setSelectedSong] = useState<Song | null>(null);
 
-  const { data: playlists } = useQuery<Playlist[]>({
-    queryKey: ["/api/playlists"],
+  // Playlists, songs and play counts arrive in a single request
+  const { data: playlists } = useQuery<LibraryPlaylist[]>({
+    queryKey: ["/api/library"],
   });
 
-
-  const { data: songs } = useQuery<Song[]>({
-    queryKey: [`/api/playlists/${selectedPlaylist?.id}/songs`],
-    enabled: !!selectedPlaylist,
-  });
+  const selectedPlaylist =
+    playlists?.find((p) => p.id === selectedPlaylistId) || null;
+  const songs = selectedPlaylist?.songs;
 
 
   return (
@@ -26,14 +26,14 @@ export default function HomePage() {
       {!selectedPlaylist ? (
         <PlaylistGrid
           playlists={playlists || []}
-          onSelect={setSelectedPlaylist}
+          onSelect={(playlist) => setSelectedPlaylistId(playlist.id)}
         />
       ) : (
         <div className="h-screen flex flex-col">
           <SongList
             playlist={selectedPlaylist}
             songs={songs || []}
-            onBack={() => setSelectedPlaylist(null)}
+            onBack={() => setSelectedPlaylistId(null)}
             onSelect={setSelectedSong}
             selectedSong={selectedSong}
           />
@@ -1,11 +1,13 @@
 # admin_routes.py
-from flask import Blueprint, request, flash, redirect, url_for, current_app
+from flask import Blueprint, request, flash, redirect, url_for, current_app, jsonify
 from flask_admin import Admin, form, expose
 from flask_admin.contrib.sqla import ModelView
 import os
-from server.models import db, Lesson, Line, Song
+from server.models import db, Lesson, Line
+from server.jobs import enqueue_job, latest_job, job_to_dict
+from server import blob_store
+from server.audio_analysis import analyze
 from markupsafe import Markup
-from pydub import AudioSegment
 
 # Optional: protect admin with Flask-Login later
 admin_bp = Blueprint('admin_files', __name__)
@@ -29,8 +31,9 @@ class LineModelView(ModelView):
             return redirect(url_for('lesson.index_view'))
 
         lesson = Lesson.query.get_or_404(lesson_id)
+        build_job = latest_job('lesson_build', lesson_id)
 
-        return self.render('admin/line_custom_list.html', lesson=lesson, lines=lesson.lines)
+        return self.render('admin/line_custom_list.html', lesson=lesson, lines=lesson.lines, build_job=build_job)
 
 
     @expose('/edit/<int:id>', methods=('GET', 'POST'))
@@ -44,23 +47,25 @@ class LineModelView(ModelView):
             line.break_after = 'break_after' in request.form
 
             audio_file = request.files.get('audio_file')
+            audio_changed = False
             if audio_file and self.allowed_file(audio_file.filename):
-                lesson_id = line.lesson_id
-                line_id = line.id
-                filename = f'lesson_{lesson_id}/line_{line_id}.wav'
-                full_path = os.path.join(current_app.config['AUDIO_STORAGE_ROOT'], 'lines', filename)
+                # Stored by content: re-uploading the same clip reuses the blob
+                audio_key = blob_store.ingest_stream(audio_file.stream, blob_store.file_extension(audio_file.filename))
+                blob_store.replace_ref(line.audio_file, audio_key)
 
-                try:
-                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                except Exception as e:
-                    flash('Unable to create folder for {full_path}','error') 
-
-                audio_file.save(full_path)
-
-                line.audio_file = filename  # save relative path
+                audio_changed = line.audio_file != audio_key
+                line.audio_file = audio_key  # save blob key
 
             
             db.session.commit()
+            if audio_changed:
+                # Measured once here so lesson builds only apply the stored gain
+                try:
+                    analyze('lines', line.audio_file)
+                except Exception as e:
+                    db.session.rollback()
+                    enqueue_job('analyze_line', line.id)
+                    print(f"Analysing line {line.id} failed, queued a retry: {e}")
             flash('Line updated', 'success')
             return redirect(url_for('.index_view', lesson_id=line.lesson_id))
 
@@ -133,66 +138,29 @@ class LineModelView(ModelView):
             return redirect(url_for('lesson.index_view'))
 
         lesson = Lesson.query.get_or_404(lesson_id)
-        lines = sorted(lesson.lines, key=lambda l: l.order)
 
-        if not lines:
+        if not lesson.lines:
             flash("No lines found for this lesson", "warning")
             return redirect(url_for('.index_view', lesson_id=lesson_id))
 
-        combined = AudioSegment.empty()
-
-        try:
-            for line in lines:
-                if not line.audio_file:
-                    continue  # skip empty
-
-                audio_path = os.path.join(current_app.config['AUDIO_STORAGE_ROOT'], 'lines', line.audio_file)
-                if not os.path.exists(audio_path):
-                    flash(f"Missing file: {line.audio_file}", "error")
-                    return redirect(url_for('.index_view', lesson_id=lesson_id))
-
-                if os.path.getsize(audio_path) < 1000:
-                    flash(f"Audio file {line.audio_file} is too small or empty.", "error")
-                    return redirect(url_for('.index_view', lesson_id=lesson_id))
-
-
-                clip = AudioSegment.from_file(audio_path)
-
-                combined += clip  # no silence, no fade
-
-                if getattr(line, 'break_after', False):  # check break_after attribute
-                    silence = AudioSegment.silent(duration=len(clip))  # silence same length as clip
-                    combined += silence  # add silence break after clip
-
-            # Export combined audio
-            output_filename = f'lesson_{lesson.id}.mp3'
-            output_path = os.path.join(current_app.config['AUDIO_STORAGE_ROOT'], 'songs', output_filename)
-            combined.export(output_path, format='mp3')
-
-            # Create or update Song entry
-            if lesson.song:
-                lesson.song.audio_file = output_filename  # overwrite file path
-
-            else:
-                song = Song( title=lesson.title,
-                    artist='System',
-                    playlist_id=1,
-                    audio_file=output_filename
-                )
-                db.session.add(song)
-                db.session.flush() # Get song.id before commit
-                lesson.song = song
-
-            db.session.commit()
-
-            flash("✅ Lesson audio built and saved to Song!", "success")
-
-        except Exception as e:
-            db.session.rollback()
-            flash(f"⚠️ Build failed: {str(e)}", "error")
+        # Building decodes and re-encodes every clip, so it runs in the job
+        # worker instead of tying up this request.
+        job, created = enqueue_job('lesson_build', lesson_id)
+        if created:
+            flash(f"🔨 Build queued (job #{job.id})", "success")
+        else:
+            flash(f"A build for this lesson is already queued (job #{job.id})", "info")
 
         return redirect(url_for('.index_view', lesson_id=lesson_id))
 
+    @expose('/build/status')
+    def build_status_view(self):
+        lesson_id = request.args.get('lesson_id', type=int)
+        job = latest_job('lesson_build', lesson_id) if lesson_id else None
+        if not job:
+            return jsonify(None)
+        return jsonify(job_to_dict(job))
+
 
 # Custom Admin View for Lesson (with inline lines)
 class LessonModelView(ModelView):
@@ -0,0 +1,116 @@
+"""Cost of loudness analysis and of normalising lines in lesson builds.
+
+    python -m server.analysis_benchmark [--lines 60] [--seconds 5] [--runs 4]
+
+Makes ``--lines`` WAV clips of a tone at three different levels (-6, -18
+and -30 dB) with ffmpeg and a lesson that uses them, in a fresh SQLite
+database and blob store under a temp directory. It then
+
+1. analyses every clip (duration, peaks and loudness, as the
+   analyze_line job and the admin upload do) and reports the time per
+   clip, and
+2. builds the lesson once to warm the PCM cache, then ``--runs`` times
+   each with LESSON_NORMALIZE off and on, alternating, and reports the
+   median build time of both and the overhead.
+
+HLS segmenting is turned off so the builds only differ in normalisation.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+LEVELS_DB = (-6, -18, -30)
+
+
+def make_clips(directory, count, seconds):
+    from pydub.utils import get_encoder_name
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'clip_{i:03d}.wav')
+        subprocess.run([get_encoder_name(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', f'sine=frequency={220 + 10 * i}:duration={seconds}',
+                        '-af', f'volume={LEVELS_DB[i % len(LEVELS_DB)]}dB',
+                        '-ac', '2', '-ar', '44100', path], check=True)
+        paths.append(path)
+    return paths
+
+
+def create_lesson(clips):
+    from server import blob_store
+    from server.models import db, Lesson, Line
+
+    lesson = Lesson(title='Benchmark lesson')
+    db.session.add(lesson)
+    db.session.flush()
+    for order, path in enumerate(clips, start=1):
+        key = blob_store.ingest_file(path, 'wav')
+        blob_store.add_ref(key)
+        db.session.add(Line(text=f'line {order}', audio_file=key, order=order,
+                            lesson_id=lesson.id, break_after=bool(order % 2)))
+    db.session.commit()
+    return lesson.id
+
+
+def time_analysis(lesson_id):
+    """Seconds spent analysing each line's clip"""
+    from server.audio_analysis import analyze
+    from server.models import db, Lesson
+
+    timings = []
+    for line in db.session.get(Lesson, lesson_id).lines:
+        started = time.perf_counter()
+        analyze('lines', line.audio_file)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def time_builds(app, lesson_id, runs):
+    """``{normalize: [seconds, ...]}`` for builds with LESSON_NORMALIZE off and on"""
+    from server.lesson_builder import build_lesson
+
+    build_lesson(lesson_id)  # warm the PCM cache
+    results = {False: [], True: []}
+    for _ in range(runs):
+        for normalize in (False, True):
+            app.config['LESSON_NORMALIZE'] = normalize
+            started = time.perf_counter()
+            build_lesson(lesson_id)
+            results[normalize].append(time.perf_counter() - started)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=60)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--runs', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(directory, 'analysis.db')}")
+        os.environ.setdefault('AUDIO_STORAGE_ROOT', os.path.join(directory, 'audio'))
+        from server.app import create_app
+
+        app = create_app('testing')
+        app.config['LESSON_HLS_ENABLED'] = False
+        clips = make_clips(directory, args.lines, args.seconds)
+        with app.app_context():
+            lesson_id = create_lesson(clips)
+            analysis = time_analysis(lesson_id)
+            builds = time_builds(app, lesson_id, args.runs)
+
+    print(f"{args.lines} lines of {args.seconds:g} s, {args.runs} runs")
+    print(f"  analysis: median {statistics.median(analysis) * 1000:.0f} ms per clip, "
+          f"max {max(analysis) * 1000:.0f} ms")
+    plain, normalized = statistics.median(builds[False]), statistics.median(builds[True])
+    print(f"  build, LESSON_NORMALIZE off: median {plain:.2f} s")
+    print(f"  build, LESSON_NORMALIZE on:  median {normalized:.2f} s "
+          f"({(normalized - plain) / plain * 100:+.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
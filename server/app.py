@@ -1,17 +1,98 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_migrate import Migrate
 import os
+import threading
 from server.models import db
 from server.auth_routes import auth_bp
 from server.playlist_routes import playlist_bp
 from server.song_routes import song_bp
-from server.admin_routes import admin_bp, init_admin
+from server.upload_routes import upload_bp
+from server.metrics_routes import metrics_bp
+from server.jobs import run_jobs_command
+from server.play_ingest import init_play_buffer
+from server.catalog_cache import init_catalog_cache
+from server.password_hashing import init_password_hasher
+from server.auth_tokens import init_auth_tokens
+from server.db_pool import init_db_pool, init_engine_events
+from server.db_routing import init_replica
+from server.blob_store import gc_blobs_command, blob_hash
+from server.audio_analysis import analyze_audio_command
+from server.rebuild_lessons import rebuild_lessons_command
+from server.migrate_db import migrate_storage_command
+from server.bootstrap import bootstrap_database, bootstrap_db_command
 from server.config import config
-from werkzeug.security import generate_password_hash
-import psycopg2
 
-def create_app(config_name=None):
+class LazyAdmin:
+    """WSGI middleware that serves /admin from an app built on first use.
+
+    Flask-Admin and the views behind it are only needed by the occasional
+    admin, but importing them is a large part of startup. Flask does not
+    allow adding them to an app that has started serving, so the first
+    /admin request builds a bare app for them (create_admin_app); the rest
+    goes to the main app.
+    """
+
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self._admin_app = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path != '/admin' and not path.startswith('/admin/'):
+            return self.wsgi_app(environ, start_response)
+        if self._admin_app is None:
+            with self._lock:
+                if self._admin_app is None:
+                    self._admin_app = create_admin_app(self.app)
+        return self._admin_app(environ, start_response)
+
+
+def init_templates(app):
+    # Add audio url in to template context
+    @app.context_processor
+    def inject_audio_url():
+        return dict(audio_url='/audio/')
+
+    app.add_template_filter(blob_hash)
+
+
+def init_admin_views(app):
+    from server.admin_routes import admin_bp, init_admin
+    app.register_blueprint(admin_bp)
+    init_admin(app)
+
+
+def create_admin_app(app):
+    """An app with only the admin CMS, sharing ``app``'s state.
+
+    It uses the main app's config, extensions (play buffer, caches,
+    password hasher, storage, ...) and database engines, so it opens no
+    connection pools or worker threads of its own and its connections
+    show up in /api/metrics/pool.
+    """
+    admin_app = Flask(__name__)
+    admin_app.config.from_mapping(app.config)
+    admin_app.extensions = app.extensions
+    with app.app_context():
+        engines = db.engines
+    # Flask-SQLAlchemy keeps engines per app and has no public way to
+    # share them; init_app would create new ones
+    db._app_engines[admin_app] = engines
+    admin_app.teardown_appcontext(lambda exc: db.session.remove())
+
+    # The main app's routes too, so admin pages can url_for them; LazyAdmin
+    # still sends those requests to the main app
+    for blueprint in app.blueprints.values():
+        admin_app.register_blueprint(blueprint)
+    init_templates(admin_app)
+    init_admin_views(admin_app)
+    return admin_app
+
+
+def create_app(config_name=None, admin=None):
+    """Build the app; ``admin`` mounts the CMS now (True), or as ADMIN_LAZY_LOAD says (None)"""
 
     if config_name is None:
         config_name = os.getenv('FLASK_ENV', 'default')
@@ -21,16 +102,26 @@ def create_app(config_name=None):
 
     # Configure from config classes
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name
 
-    # Add audio url in to template context
-    @app.context_processor
-    def inject_audio_url():
-        return dict(audio_url='/audio/')
+    init_templates(app)
 
     # Initialize extensions
+    init_db_pool(app)
     db.init_app(app)
-
-    migrate = Migrate(app, db)
+    init_replica(app, db)
+    with app.app_context():
+        for engine in db.engines.values():
+            init_engine_events(app, engine)
+
+    # Only CLI commands (flask db ...) need Flask-Migrate
+    if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    init_play_buffer(app)
+    init_catalog_cache(app)
+    init_password_hasher(app)
+    init_auth_tokens(app)
 
     # Print the database URL without credentials for debugging
     db_url = app.config['SQLALCHEMY_DATABASE_URI']
@@ -43,71 +134,24 @@ def create_app(config_name=None):
     app.register_blueprint(auth_bp)
     app.register_blueprint(playlist_bp)
     app.register_blueprint(song_bp)
-    app.register_blueprint(admin_bp)
-
-    init_admin(app)
-
-    # Create database and seed data
-    with app.app_context():
-        from .models import User, Playlist, Song
-        try:
-            db.create_all()
-            print("Database tables created successfully by the App.")
-        except psycopg2.Error as e:
-            print(f"Error creating database tables: {e}")
-            return app #Return app to prevent further execution if DB creation fails
-
-        # Add seed data if database is empty
-        if not User.query.first():
-            print('creating another user')
-            admin = User(
-                username="admin@example.com",
-                password=generate_password_hash("admin123", method='pbkdf2:sha256', salt_length=8),
-                is_admin=True
-            )
-            db.session.add(admin)
-
-            # Create playlists
-            chill = Playlist(
-                title="Level 1",
-                description="If you are a beginner start here!!"
-            )
-            workout = Playlist(
-                title="Level 2",
-                description="For intermediate students only"
-            )
-            db.session.add_all([chill, workout])
-            db.session.commit()
-
-            # Add songs
-            songs = [
-                Song(
-                    title="Exercise 1",
-                    artist="Nature Sounds",
-                    playlist_id=chill.id,
-                    audio_file="amharic_lesson_1.mp3"
-                ),
-                Song(
-                    title="Exercise 2",
-                    artist="Ambient Music",
-                    playlist_id=chill.id,
-                    audio_file="amharic_lesson_2.mp3"
-                ),
-                Song(
-                    title="Exercise 3",
-                    artist="Energy Beats",
-                    playlist_id=workout.id,
-                    audio_file="amharic_lesson_3.mp3"
-                ),
-                Song(
-                    title="Exercise 4",
-                    artist="Workout Kings",
-                    playlist_id=workout.id,
-                    audio_file="amharic_lesson_4.mp3"
-                )
-            ]
-            db.session.add_all(songs)
-            db.session.commit()
+    app.register_blueprint(upload_bp)
+    app.register_blueprint(metrics_bp)
+
+    if admin or (admin is None and not app.config['ADMIN_LAZY_LOAD']):
+        init_admin_views(app)
+    elif admin is None:
+        app.wsgi_app = LazyAdmin(app.wsgi_app, app)
+
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(gc_blobs_command)
+    app.cli.add_command(analyze_audio_command)
+    app.cli.add_command(rebuild_lessons_command)
+    app.cli.add_command(migrate_storage_command)
+    app.cli.add_command(bootstrap_db_command)
+
+    if app.config['DB_BOOTSTRAP_ON_START']:
+        with app.app_context():
+            bootstrap_database()
 
    #Added test endpoint
     @app.route('/api/test', methods=['GET'])
@@ -0,0 +1,197 @@
+"""Durations, waveform peaks and loudness for song and line audio.
+
+An ``analyze_song``/``analyze_line`` job decodes the audio once and stores
+its duration, a downsampled peak array and its loudness in AudioAnalysis. Rows are keyed
+by the audio's storage path, which for blob-backed audio includes the
+content hash, so changed audio simply gets a new row and unchanged audio
+is never decoded twice. ``flask analyze-audio`` fills in whatever is
+missing, e.g. for audio that predates this table.
+
+Peaks are AUDIO_PEAKS_PER_SECOND buckets of interleaved (min, max) int8
+samples of the mono mix: two bytes per bucket, sent to clients as is.
+
+Loudness is a gated RMS level in dBFS, in the spirit of EBU R128 but
+without its K-weighting filter: buckets quieter than -70 dBFS, and then
+ones more than 10 dB below the average of the rest, are left out so
+pauses do not drag the level down. Lesson builds use it to even out
+line levels (see line_gain).
+"""
+import math
+import os
+
+import click
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from server.models import db, AudioAnalysis, Song, Line
+from server.audio_pipeline import decode_pcm_chunks
+from server.pcm_cache import SAMPLE_RATE, SAMPLE_WIDTH
+from server import blob_store
+
+
+class AnalysisError(Exception):
+    """Raised when audio cannot be analysed"""
+
+
+def analysis_key(kind, name):
+    """Storage-relative path of a Song ('songs') or Line ('lines') audio_file"""
+    return blob_store.audio_url_path(kind, name)
+
+
+# Bumped whenever the stored fields change; older rows are recomputed
+ANALYSIS_VERSION = 2
+
+ABSOLUTE_GATE_DB = -70.0
+RELATIVE_GATE_DB = -10.0
+
+
+def compute_analysis(chunks, peaks_per_second, sample_rate=SAMPLE_RATE):
+    """Reduce mono s16le PCM chunks to ``(duration_ms, peaks bytes, loudness dBFS)``.
+
+    Whole buckets are reduced with one vectorised min/max/mean-square per
+    chunk; only the remainder of each chunk is carried over to the next.
+    """
+    import numpy as np
+
+    bucket = max(1, sample_rate // peaks_per_second)
+    pending = np.empty(0, dtype='<i2')
+    mins, maxs, energies = [], [], []
+    total = 0
+
+    for chunk in chunks:
+        samples = np.frombuffer(chunk, dtype='<i2')
+        total += len(samples)
+        if len(pending):
+            samples = np.concatenate((pending, samples))
+        whole = len(samples) - len(samples) % bucket
+        if whole:
+            buckets = samples[:whole].reshape(-1, bucket)
+            mins.append(buckets.min(axis=1))
+            maxs.append(buckets.max(axis=1))
+            scaled = buckets.astype(np.float32) / 32768
+            energies.append(np.einsum('ij,ij->i', scaled, scaled) / bucket)
+        pending = samples[whole:].copy()
+
+    if len(pending):
+        mins.append(pending.min(keepdims=True))
+        maxs.append(pending.max(keepdims=True))
+        scaled = pending.astype(np.float32) / 32768
+        energies.append(np.array([np.dot(scaled, scaled) / len(scaled)]))
+
+    peaks = np.empty(0, dtype=np.int8)
+    if mins:
+        # int16 -> int8 keeps the high byte, which is plenty for drawing
+        pairs = np.stack((np.concatenate(mins), np.concatenate(maxs)), axis=1)
+        peaks = (pairs >> 8).astype(np.int8).ravel()
+
+    loudness = None
+    if energies:
+        loudness = _gated_loudness(np.concatenate(energies))
+
+    return total * 1000 // sample_rate, peaks.tobytes(), loudness
+
+
+def _gated_loudness(energies):
+    """Mean level in dBFS of the buckets that pass both gates, or None for silence"""
+    def level(values):
+        return 10 * math.log10(float(values.mean())) if len(values) and values.mean() > 0 else None
+
+    gated = energies[energies > 10 ** (ABSOLUTE_GATE_DB / 10)]
+    average = level(gated)
+    if average is None:
+        return None
+    gated = gated[gated > 10 ** ((average + RELATIVE_GATE_DB) / 10)]
+    return level(gated)
+
+
+def peak_level(analysis):
+    """Highest absolute sample level in dBFS, from the stored peaks"""
+    peak = max((abs(value) for value in memoryview(analysis.peaks).cast('b')), default=0)
+    return 20 * math.log10((peak + 1) / 128)
+
+
+def line_gain(analysis):
+    """Linear gain that brings a clip to LESSON_LOUDNESS_TARGET_DB.
+
+    Limited to +/- LESSON_MAX_GAIN_DB and to what the clip's peaks allow
+    without clipping. Silent or unanalysed clips are left alone.
+    """
+    if analysis is None or analysis.loudness_db is None:
+        return 1.0
+    max_gain = current_app.config['LESSON_MAX_GAIN_DB']
+    gain_db = current_app.config['LESSON_LOUDNESS_TARGET_DB'] - analysis.loudness_db
+    gain_db = max(-max_gain, min(gain_db, max_gain, -peak_level(analysis)))
+    return 10 ** (gain_db / 20)
+
+
+def analyze(kind, name):
+    """Return the AudioAnalysis for an audio_file, computing it if missing"""
+    key = analysis_key(kind, name)
+    existing = db.session.get(AudioAnalysis, key)
+    if existing is not None and existing.version >= ANALYSIS_VERSION:
+        return existing
+
+    path = blob_store.resolve_audio_path(kind, name)
+    if not os.path.exists(path):
+        raise AnalysisError(f"Missing file: {name}")
+
+    peaks_per_second = current_app.config['AUDIO_PEAKS_PER_SECOND']
+    duration_ms, peaks, loudness = compute_analysis(
+        decode_pcm_chunks(path, channels=1, chunk_size=SAMPLE_RATE * SAMPLE_WIDTH),
+        peaks_per_second,
+    )
+
+    analysis = existing or AudioAnalysis(audio_file=key)
+    analysis.duration_ms = duration_ms
+    analysis.peaks_per_second = peaks_per_second
+    analysis.peaks = peaks
+    analysis.loudness_db = loudness
+    analysis.version = ANALYSIS_VERSION
+    db.session.add(analysis)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # another worker analysed the same audio first
+        analysis = db.session.get(AudioAnalysis, key)
+    return analysis
+
+
+def analyze_song(song_id, progress=None):
+    song = db.session.get(Song, song_id)
+    if song is None:
+        raise AnalysisError(f"Song {song_id} not found")
+    analyze('songs', song.audio_file)
+
+
+def analyze_line(line_id, progress=None):
+    line = db.session.get(Line, line_id)
+    if line is None:
+        raise AnalysisError(f"Line {line_id} not found")
+    if line.audio_file:
+        analyze('lines', line.audio_file)
+
+
+def missing_analyses():
+    """``(kind, audio_file)`` pairs that have no AudioAnalysis yet"""
+    known = set(db.session.scalars(select(AudioAnalysis.audio_file)
+                                  .where(AudioAnalysis.version >= ANALYSIS_VERSION)))
+    for kind, column in (('songs', Song.audio_file), ('lines', Line.audio_file)):
+        for name in db.session.scalars(select(column).where(column.isnot(None), column != '').distinct()):
+            if analysis_key(kind, name) not in known:
+                yield kind, name
+
+
+@click.command('analyze-audio')
+def analyze_audio_command():
+    """Compute durations, peaks and loudness for audio that has none yet."""
+    done = failed = 0
+    for kind, name in list(missing_analyses()):
+        try:
+            analyze(kind, name)
+            done += 1
+        except Exception as e:
+            db.session.rollback()
+            failed += 1
+            print(f"Could not analyse {kind}/{name}: {e}")
+    print(f"Analysed {done} files, {failed} failed")
@@ -0,0 +1,203 @@
+"""Streaming PCM helpers for building lesson audio, and other ffmpeg jobs.
+
+Lesson audio is produced as a generator of raw PCM chunks that is piped
+straight into an ffmpeg encoder, so memory use stays at a few chunks no
+matter how long the lesson is.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+from server.pcm_cache import SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH
+
+CHUNK_SIZE = 256 * 1024  # a multiple of the frame size
+
+# Shared, read-only buffer that silence is sliced from
+_ZEROS = bytes(CHUNK_SIZE)
+
+
+class EncodeError(Exception):
+    """Raised when the encoder process fails"""
+
+
+def pcm_file_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def decode_pcm_chunks(path, channels=CHANNELS, sample_rate=SAMPLE_RATE, chunk_size=CHUNK_SIZE):
+    """Decode any audio file with ffmpeg and yield its s16le PCM in chunks"""
+    from pydub.utils import get_encoder_name
+
+    command = [
+        get_encoder_name(), '-loglevel', 'error',
+        '-i', path,
+        '-vn', '-f', f's{SAMPLE_WIDTH * 8}le', '-ac', str(channels), '-ar', str(sample_rate),
+        'pipe:1',
+    ]
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', 'replace').strip()
+            raise EncodeError(f"ffmpeg exited with {returncode}: {message}")
+
+
+def apply_gain(chunk, gain):
+    """Scale a chunk of s16le PCM by ``gain``, clipping at full scale"""
+    if abs(gain - 1.0) < 1e-3:
+        return chunk
+    import numpy as np
+    samples = np.frombuffer(chunk, dtype='<i2').astype(np.float32)
+    samples *= gain
+    np.clip(samples, -32768, 32767, out=samples)
+    return samples.astype('<i2').tobytes()
+
+
+def silence_chunks(num_bytes):
+    """Yield ``num_bytes`` of silent PCM without allocating a buffer that large"""
+    view = memoryview(_ZEROS)
+    while num_bytes > 0:
+        size = min(num_bytes, CHUNK_SIZE)
+        yield view[:size]
+        num_bytes -= size
+
+
+def encode_pcm_stream(chunks, output_path, format='mp3', bitrate='128k'):
+    """Feed PCM chunks to ffmpeg and atomically write the encoded file.
+
+    Returns the number of PCM bytes consumed.
+    """
+    from pydub.utils import get_encoder_name
+
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=f'.{format}.tmp')
+    os.close(fd)
+
+    command = [
+        get_encoder_name(), '-y', '-loglevel', 'error',
+        '-f', f's{SAMPLE_WIDTH * 8}le', '-ar', str(SAMPLE_RATE), '-ac', str(CHANNELS),
+        '-i', 'pipe:0',
+        '-f', format,
+    ]
+    if bitrate:
+        command += ['-b:a', bitrate]
+    command.append(tmp_path)
+
+    total = 0
+    try:
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=stderr)
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+                    total += len(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its stderr explains why
+            finally:
+                process.stdin.close()
+                returncode = process.wait()
+
+            if returncode != 0:
+                stderr.seek(0)
+                message = stderr.read().decode('utf-8', 'replace').strip()
+                raise EncodeError(f"ffmpeg exited with {returncode}: {message}")
+
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return total
+
+
+def transcode_file(input_path, output_path, format='mp3', bitrate='128k'):
+    """Re-encode an audio file with ffmpeg, atomically writing ``output_path``"""
+    from pydub.utils import get_encoder_name
+
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=f'.{format}.tmp')
+    os.close(fd)
+
+    command = [
+        get_encoder_name(), '-y', '-loglevel', 'error',
+        '-i', input_path,
+        '-vn', '-map_metadata', '-1',  # drop cover art and tags
+        '-f', format,
+    ]
+    if bitrate:
+        command += ['-b:a', bitrate]
+    command.append(tmp_path)
+
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            message = result.stderr.decode('utf-8', 'replace').strip()
+            raise EncodeError(f"ffmpeg exited with {result.returncode}: {message}")
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def segment_hls(input_path, output_dir, segment_seconds=6):
+    """Split an mp3 into MPEG-TS segments plus an ``index.m3u8`` VOD playlist.
+
+    The audio is copied, not re-encoded. Everything is written to a
+    sibling temp directory that is renamed into place at the end, so
+    ``output_dir`` either holds a complete set of files or does not exist.
+    """
+    from pydub.utils import get_encoder_name
+
+    parent = os.path.dirname(output_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+
+    command = [
+        get_encoder_name(), '-y', '-loglevel', 'error',
+        '-i', input_path,
+        '-vn', '-map_metadata', '-1', '-c:a', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(segment_seconds),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(tmp_dir, 'seg_%05d.ts'),
+        os.path.join(tmp_dir, 'index.m3u8'),
+    ]
+
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            message = result.stderr.decode('utf-8', 'replace').strip()
+            raise EncodeError(f"ffmpeg exited with {result.returncode}: {message}")
+        os.chmod(tmp_dir, 0o755)
+        os.rename(tmp_dir, output_dir)
+    except OSError:
+        if not os.path.isdir(output_dir):
+            raise
+        # Another build produced the same segments first
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,180 @@
+import os
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from flask import Response, request, abort
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header, parse_range_header
+
+# Chunk size used when the server has no zero-copy file wrapper
+CHUNK_SIZE = 64 * 1024
+
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def file_etag(stat):
+    """Validator derived from mtime and size, cheap enough to compute on every request"""
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def send_audio(path, mimetype='audio/mpeg', max_age=0, etag=None, immutable=False):
+    """Serve an audio file with conditional GET and byte range support.
+
+    Handles single, open-ended, suffix and multi-range requests, answers
+    revalidation with 304 and hands whole-tail ranges to the server's
+    ``wsgi.file_wrapper`` so gunicorn can use sendfile. ``immutable`` is for
+    URLs whose content can never change, such as versioned blob URLs.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        abort(404)
+
+    size = stat.st_size
+    etag = etag or file_etag(stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': f'public, max-age={max_age}' if max_age else 'no-cache',
+    }
+    if immutable:
+        headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    ranges = _requested_ranges(size, etag, last_modified)
+    if ranges is None:
+        return _file_response(path, 200, mimetype, headers, 0, size, size)
+
+    if not ranges:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        return _file_response(path, 206, mimetype, headers, start, stop, size)
+
+    return _multipart_response(path, mimetype, headers, ranges, size)
+
+
+def _requested_ranges(size, etag, last_modified):
+    """Resolve the Range header into sorted, merged ``(start, stop)`` pairs.
+
+    Returns ``None`` when the whole file should be sent and an empty list
+    when none of the requested ranges can be satisfied.
+    """
+    header = request.headers.get('Range')
+    if not header or request.method not in ('GET', 'HEAD'):
+        return None
+
+    if_range = parse_if_range_header(request.headers.get('If-Range'))
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None and if_range.date != last_modified:
+        return None
+
+    parsed = parse_range_header(header)
+    if parsed is None or parsed.units != 'bytes' or len(parsed.ranges) > MAX_RANGES:
+        return None
+
+    resolved = []
+    for start, stop in parsed.ranges:
+        if start < 0:
+            start = max(size + start, 0)
+            stop = size
+        elif stop is None or stop > size:
+            stop = size
+        if start < stop:
+            resolved.append((start, stop))
+
+    resolved.sort()
+    merged = []
+    for start, stop in resolved:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _file_response(path, status, mimetype, headers, start, stop, size):
+    length = stop - start
+
+    # gunicorn's file wrapper sendfile()s from the current offset up to
+    # Content-Length, but not every server honours the length, so only the
+    # tail of the file is handed over.
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    f = None
+    if file_wrapper is not None and stop == size:
+        f = open(path, 'rb')
+        f.seek(start)
+        body = file_wrapper(f, CHUNK_SIZE)
+    else:
+        body = _iter_file(path, start, length)
+
+    response = Response(body, status=status, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    response.content_length = length
+    if f is not None:
+        # HEAD responses are never iterated, so the wrapper may never close it
+        response.call_on_close(f.close)
+    return response
+
+
+def _iter_file(path, start, length):
+    # Opened on first iteration, so HEAD requests and responses that are
+    # never sent hold no file
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _multipart_response(path, mimetype, headers, ranges, size):
+    boundary = uuid4().hex
+    part_headers = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('latin-1')
+        for start, stop in ranges
+    ]
+    closing = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+
+    # Every part after the first is preceded by the CRLF that ends the previous one
+    content_length = len(closing) + 2 * (len(ranges) - 1)
+    content_length += sum(len(h) + stop - start for h, (start, stop) in zip(part_headers, ranges))
+
+    def generate():
+        with open(path, 'rb') as f:
+            for index, ((start, stop), part_header) in enumerate(zip(ranges, part_headers)):
+                if index:
+                    yield b'\r\n'
+                yield part_header
+                f.seek(start)
+                remaining = stop - start
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            yield closing
+
+    response = Response(
+        generate(),
+        status=206,
+        content_type=f'multipart/byteranges; boundary={boundary}',
+        headers=headers,
+        direct_passthrough=True,
+    )
+    response.content_length = content_length
+    return response
@@ -1,9 +1,29 @@
-from flask import Blueprint, request, jsonify, session
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, request, jsonify, session, current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from server.models import db, User
+from server.password_hashing import get_password_hasher, login_user_cache, HashingBusy
+from server.auth_tokens import issue_token, bearer_claims, revoke_token
 
 auth_bp = Blueprint('auth', __name__)
 
+def _busy():
+    response = jsonify({"error": "Too many logins right now, please try again"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def _find_login(username):
+    """``(id, password hash, is_admin)`` of a user, or None"""
+    cache = login_user_cache()
+    found = cache.get(username)
+    if found is None:
+        row = db.session.execute(select(User.id, User.password, User.is_admin).where(User.username == username)).first()
+        if row is None:
+            return None
+        found = (row.id, row.password, bool(row.is_admin))
+        cache.set(username, found)
+    return found
+
 @auth_bp.route('/api/register', methods=['POST'])
 def register():
     data = request.json
@@ -11,23 +31,26 @@ def register():
         return jsonify({"error": "Username and password required"}), 400
 
     # Check if user already exists
-    existing_user = User.query.filter_by(username=data['username']).first()
-    if existing_user:
+    if _find_login(data['username']) is not None:
         return jsonify({"error": "Username already exists"}), 409
 
     # Create new user
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256',  salt_length=8)
+    try:
+        hashed_password = get_password_hasher().hash(data['password'])
+    except HashingBusy:
+        return _busy()
     new_user = User(username=data['username'], password=hashed_password)
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # registered by a concurrent request
+        return jsonify({"error": "Username already exists"}), 409
 
     # Set session
     session['user_id'] = new_user.id
     
-    return jsonify({
-        "id": new_user.id,
-        "username": new_user.username
-    }), 201
+    return jsonify(_login_response(new_user.id, new_user.username, False)), 201
 
 @auth_bp.route('/api/login', methods=['POST'])
 def login():
@@ -35,26 +58,71 @@ def login():
     if not data or not data.get('username') or not data.get('password'):
         return jsonify({"error": "Username and password required"}), 400
 
-    user = User.query.filter_by(username=data['username']).first()
-    if not user or not check_password_hash(user.password, data['password']):
-        return jsonify({"error": "Invalid credentials"}), 401
+    hasher = get_password_hasher()
+    found = _find_login(data['username'])
+    try:
+        if not found or not hasher.verify(found[1], data['password']):
+            return jsonify({"error": "Invalid credentials"}), 401
+    except HashingBusy:
+        return _busy()
+    user_id, pwhash, is_admin = found
+
+    if hasher.needs_rehash(pwhash):
+        _rehash(data['username'], user_id, pwhash, is_admin, data['password'])
 
     # Set session
-    session['user_id'] = user.id
+    session['user_id'] = user_id
     
-    return jsonify({
-        "id": user.id,
-        "username": user.username
-    }), 200
+    return jsonify(_login_response(user_id, data['username'], is_admin)), 200
+
+def _login_response(user_id, username, is_admin):
+    body = {
+        "id": user_id,
+        "username": username
+    }
+    if current_app.config['AUTH_TOKENS_ENABLED']:
+        body["token"], body["expiresIn"] = issue_token(user_id, username, is_admin)
+    return body
+
+def _rehash(username, user_id, old_hash, is_admin, password):
+    """Upgrade a stored hash to PASSWORD_HASH_METHOD; skipped when hashing is busy"""
+    try:
+        new_hash = get_password_hasher().hash(password)
+    except HashingBusy:
+        return  # try again on a later login
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.password == old_hash)
+        .values(password=new_hash)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount:
+        login_user_cache().set(username, (user_id, new_hash, is_admin))
+    else:
+        login_user_cache().pop(username)  # changed meanwhile; reload next time
 
 @auth_bp.route('/api/logout', methods=['POST'])
 def logout():
+    # Bearer tokens stay valid until they expire unless revoked
+    claims = bearer_claims()
+    if claims is not None:
+        revoke_token(claims)
+
     # Clear the session
     session.pop('user_id', None)
     return '', 200
 
 @auth_bp.route('/api/user', methods=['GET'])
 def get_user():
+    # A bearer token's claims already name the user
+    claims = bearer_claims()
+    if claims is not None:
+        return jsonify({
+            "id": claims['uid'],
+            "username": claims['name']
+        }), 200
+
     # Get user from session
     user_id = session.get('user_id')
     if not user_id:
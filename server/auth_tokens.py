@@ -0,0 +1,134 @@
+"""Signed bearer tokens, an alternative to the session cookie.
+
+With AUTH_TOKENS_ENABLED, login and register also return a token that
+clients can send as ``Authorization: Bearer <token>``. A token holds the
+user's claims ``{uid, name, admin, jti}``, timestamped and HMAC-SHA256
+signed with SECRET_KEY, and expires after AUTH_TOKEN_MAX_AGE seconds.
+Since the claims already say who the caller is, authenticated requests
+need no user lookup.
+
+Checked tokens are kept in an LRU cache until they expire, so the
+common path is a dictionary lookup rather than an HMAC. Revoked token
+ids (RevokedToken, written on logout) are checked in memory too: each
+process reloads them every AUTH_REVOCATION_REFRESH seconds, so a token
+revoked in another worker stops working within that time, and at once in
+the worker that revoked it.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g, request, session
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from server.cache import TTLCache
+from server.models import db, RevokedToken
+
+TOKEN_SALT = 'auth-token'
+
+
+class _Revocations:
+    """Ids of revoked, unexpired tokens, reloaded from the database now and then"""
+
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self._jtis = frozenset()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self.reload()
+        return jti in self._jtis
+
+    def reload(self):
+        # One thread reloads; the others keep using the current set meanwhile
+        if not self._lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            now = datetime.utcnow()
+            # From the primary: a replica lagging behind would let a revoked token through
+            self._jtis = frozenset(db.session.scalars(
+                select(RevokedToken.jti).where(RevokedToken.expires_at > now)
+                .execution_options(primary=True)))
+            self._loaded_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def add(self, jti):
+        with self._lock:
+            self._jtis = self._jtis | {jti}
+
+
+def init_auth_tokens(app):
+    app.extensions['auth_token_cache'] = TTLCache(
+        maxsize=app.config['AUTH_TOKEN_CACHE_MAX_ENTRIES'],
+        ttl=app.config['AUTH_TOKEN_MAX_AGE'],
+    )
+    app.extensions['auth_token_revocations'] = _Revocations(app.config['AUTH_REVOCATION_REFRESH'])
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT,
+                                  signer_kwargs={'digest_method': hashlib.sha256})
+
+
+def issue_token(user_id, username, is_admin):
+    """``(token, seconds until it expires)``"""
+    claims = {"uid": user_id, "name": username, "admin": bool(is_admin), "jti": uuid.uuid4().hex}
+    return _serializer().dumps(claims), current_app.config['AUTH_TOKEN_MAX_AGE']
+
+
+def verify_token(token):
+    """The claims of a valid, unrevoked token, or None"""
+    cache = current_app.extensions['auth_token_cache']
+    claims = cache.get(token)
+    if claims is None:
+        max_age = current_app.config['AUTH_TOKEN_MAX_AGE']
+        try:
+            claims, issued_at = _serializer().loads(token, max_age=max_age, return_timestamp=True)
+        except BadSignature:  # includes expired tokens
+            return None
+        remaining = max_age - (datetime.now(timezone.utc) - issued_at).total_seconds()
+        if remaining <= 0:
+            return None
+        claims['exp'] = (issued_at + timedelta(seconds=max_age)).replace(tzinfo=None)
+        cache.set(token, claims, ttl=remaining)
+
+    if claims['jti'] in current_app.extensions['auth_token_revocations']:
+        return None
+    return claims
+
+
+def revoke_token(claims):
+    """Stop accepting a token before it expires"""
+    now = datetime.utcnow()
+    db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+    db.session.add(RevokedToken(jti=claims['jti'], user_id=claims['uid'], expires_at=claims['exp']))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # already revoked
+    current_app.extensions['auth_token_revocations'].add(claims['jti'])
+
+
+def bearer_claims():
+    """Claims of the request's bearer token, or None if it has no valid one"""
+    if not current_app.config['AUTH_TOKENS_ENABLED']:
+        return None
+    if 'bearer_claims' not in g:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        g.bearer_claims = verify_token(token.strip()) if scheme.lower() == 'bearer' and token else None
+    return g.bearer_claims
+
+
+def current_user_id():
+    """Id of the calling user, from a bearer token or the session"""
+    claims = bearer_claims()
+    if claims is not None:
+        return claims['uid']
+    return session.get('user_id')
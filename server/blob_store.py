@@ -0,0 +1,274 @@
+"""Content-addressed audio storage.
+
+Audio is stored once per distinct content under
+``AUDIO_STORAGE_ROOT/blobs/<aa>/<bb>/<sha256>.<ext>`` and referenced from
+``Song.audio_file``/``Line.audio_file`` by that relative key. AudioBlob
+rows count the references so ``flask gc-blobs`` can delete content nobody
+points at any more. Because a key never changes meaning, blob-backed audio
+can be served with long-lived immutable cache headers.
+
+Rows created before the blob store keep their legacy names, which are
+still resolved relative to ``AUDIO_STORAGE_ROOT/<kind>``.
+
+All paths above are storage keys; where the files live (local disk or an
+S3 bucket behind a disk cache) is up to storage_backends.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from server.models import db, AudioBlob, AudioRendition, AudioAnalysis, Song, Line, SongUpload
+from server.storage_backends import get_storage
+
+BLOB_PREFIX = 'blobs/'
+TEMP_PREFIX = 'blobs/tmp/'
+DERIVED_DIRS = ('hls',)
+READ_SIZE = 1024 * 1024
+
+
+def is_blob_key(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def blob_hash(name):
+    """The sha256 of a blob key, or None for legacy file names"""
+    if not is_blob_key(name):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def audio_url_path(kind, name):
+    """Storage key of a Song/Line audio_file value; ``kind`` is 'songs' or 'lines'"""
+    return name if is_blob_key(name) else f'{kind}/{name}'
+
+
+def resolve_audio_path(kind, name):
+    """Local path of a Song/Line audio_file value, fetched from remote storage if needed"""
+    return get_storage().local_path(audio_url_path(kind, name))
+
+
+def file_extension(filename, default='mp3'):
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return ext if ext.isalnum() and len(ext) <= 10 else default
+
+
+def blob_key(sha256, ext):
+    return f'{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext.lower().lstrip(".")}'
+
+
+def temp_dir():
+    """Scratch space next to the store, so ingesting from it is a rename where possible"""
+    return get_storage().temp_dir()
+
+
+def temp_path(suffix=''):
+    fd, path = tempfile.mkstemp(dir=temp_dir(), suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def ingest_file(path, ext, sha256=None):
+    """Move ``path`` into the store and return its key.
+
+    If the same content is already stored the file is simply deleted. The
+    AudioBlob row is created if needed; references are added separately
+    with add_ref so they commit together with the row that uses them.
+    """
+    if sha256 is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_SIZE), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+    key = blob_key(sha256, ext)
+    size = os.path.getsize(path)
+
+    storage = get_storage()
+    if storage.exists(key):
+        os.remove(path)
+    else:
+        storage.put_file(path, key)
+
+    if db.session.get(AudioBlob, sha256) is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(AudioBlob(sha256=sha256, ext=key.rsplit('.', 1)[1], size=size))
+        except IntegrityError:
+            pass  # another request stored the same content first
+    return key
+
+
+def ingest_stream(stream, ext):
+    """Copy a readable stream into the store, hashing it on the way"""
+    path = temp_path()
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(READ_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return ingest_file(path, ext, sha256=digest.hexdigest())
+
+
+def _adjust_refs(name, delta):
+    sha256 = blob_hash(name)
+    if sha256 is None:
+        return
+    db.session.execute(
+        update(AudioBlob)
+        .where(AudioBlob.sha256 == sha256)
+        .values(ref_count=AudioBlob.ref_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def add_ref(name):
+    _adjust_refs(name, 1)
+
+
+def release(name):
+    _adjust_refs(name, -1)
+
+
+def replace_ref(old, new):
+    if old != new:
+        release(old)
+        add_ref(new)
+
+
+def _reference_columns():
+    return [Song.audio_file, Line.audio_file, AudioRendition.audio_file]
+
+
+def recount_refs():
+    """Recompute every ref_count from the columns that point at blobs"""
+    counts = {}
+    for column in _reference_columns():
+        rows = db.session.execute(
+            select(column, func.count()).where(column.like(f'{BLOB_PREFIX}%')).group_by(column)
+        )
+        for name, count in rows:
+            sha256 = blob_hash(name)
+            counts[sha256] = counts.get(sha256, 0) + count
+
+    for blob in AudioBlob.query.all():
+        blob.ref_count = counts.get(blob.sha256, 0)
+    db.session.commit()
+
+
+def expire_scratch(max_age, dry_run=False):
+    """Expire uploads left open (or mid-commit when a worker died) longer than ``max_age`` and delete old scratch files.
+
+    Returns ``(expired uploads, removed files, bytes freed)``.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    expired = SongUpload.query.filter(SongUpload.status.in_(('open', 'committing')),
+                                      SongUpload.updated_at < cutoff).all()
+    if not dry_run:
+        for upload in expired:
+            upload.status = 'expired'
+        db.session.commit()
+
+    # .part files of those uploads, chunks and builds a crash left behind.
+    # Scratch space is always local, whatever the storage backend.
+    removed = freed = 0
+    cutoff_ts = time.time() - max_age
+    for dirpath, _, filenames in os.walk(temp_dir()):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime >= cutoff_ts:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            removed += 1
+            freed += stat.st_size
+    return len(expired), removed, freed
+
+
+def collect_garbage(grace_seconds, dry_run=False):
+    """Delete unreferenced blobs, stray files and derived data older than ``grace_seconds``"""
+    recount_refs()
+    storage = get_storage()
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    removed_rows = removed_files = freed = 0
+
+    orphans = AudioBlob.query.filter(AudioBlob.ref_count <= 0, AudioBlob.created_at < cutoff).all()
+    for blob in orphans:
+        if not dry_run:
+            storage.delete(blob_key(blob.sha256, blob.ext))
+            db.session.delete(blob)
+        removed_rows += 1
+        freed += blob.size or 0
+    db.session.commit()
+
+    # Files with no row at all, e.g. left behind by a crash mid-ingest
+    known = set(db.session.scalars(select(AudioBlob.sha256)))
+    cutoff_ts = time.time() - grace_seconds
+    for key, size, mtime in list(storage.iter_files(BLOB_PREFIX)):
+        if key.startswith(TEMP_PREFIX):
+            continue  # in-progress uploads and builds; see expire_scratch
+        sha256 = os.path.splitext(os.path.basename(key))[0]
+        if sha256 in known or mtime >= cutoff_ts:
+            continue
+        freed += size
+        if not dry_run:
+            storage.delete(key)
+        removed_files += 1
+
+    # Durations and peaks of blobs that are gone
+    for analysis in AudioAnalysis.query.filter(AudioAnalysis.audio_file.like(f'{BLOB_PREFIX}%')):
+        if blob_hash(analysis.audio_file) not in known:
+            if not dry_run:
+                db.session.delete(analysis)
+            removed_rows += 1
+    db.session.commit()
+
+    # Data derived from a blob (HLS segments) is stored under
+    # <dir>/<sha256>/ and goes when the blob does
+    for derived in DERIVED_DIRS:
+        for key, size, mtime in list(storage.iter_files(f'{derived}/')):
+            sha256 = key.split('/')[1]
+            if sha256 in known or mtime >= cutoff_ts:
+                continue
+            freed += size
+            if not dry_run:
+                storage.delete(key)
+            removed_files += 1
+
+    return removed_rows, removed_files, freed
+
+
+@click.command('gc-blobs')
+@click.option('--grace', default=3600, show_default=True,
+              help='Only delete blobs older than this many seconds.')
+@click.option('--upload-max-age', type=int, default=None,
+              help='Expire uploads idle for this many seconds [default: UPLOAD_EXPIRE_SECONDS].')
+@click.option('--dry-run', is_flag=True, help='Report what would be deleted.')
+def gc_blobs_command(grace, upload_max_age, dry_run):
+    """Delete audio blobs that no Song, Line or rendition references."""
+    if upload_max_age is None:
+        upload_max_age = current_app.config['UPLOAD_EXPIRE_SECONDS']
+    uploads, scratch_files, scratch_freed = expire_scratch(upload_max_age, dry_run=dry_run)
+    rows, files, freed = collect_garbage(grace, dry_run=dry_run)
+    verb = 'Would remove' if dry_run else 'Removed'
+    print(f"{verb} {rows} unreferenced blobs and {files} stray files ({freed / 1024 / 1024:.1f} MiB)")
+    print(f"{'Would expire' if dry_run else 'Expired'} {uploads} abandoned uploads and "
+          f"{verb.lower()} {scratch_files} scratch files ({scratch_freed / 1024 / 1024:.1f} MiB)")
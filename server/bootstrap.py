@@ -0,0 +1,88 @@
+"""Create missing tables and seed an empty database.
+
+create_app does this on every start when DB_BOOTSTRAP_ON_START is set
+(the default outside production). Production skips it, so workers and
+cold starts do not pay for the DDL and the seed check; run
+``flask bootstrap-db`` (or ``flask db upgrade``) when deploying instead.
+"""
+import click
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from werkzeug.security import generate_password_hash
+
+from server.models import db, CatalogVersion, User, Playlist, Song
+
+
+def bootstrap_database():
+    """Create tables on the primary and add seed data if there are no users"""
+    try:
+        db.create_all(bind_key=None)  # not on the read replica
+        print("Database tables created successfully by the App.")
+    except DBAPIError as e:
+        print(f"Error creating database tables: {e}")
+        return  # nothing to seed without tables
+
+    # The shared catalog version (see catalog_cache.py)
+    if db.session.get(CatalogVersion, 1) is None:
+        db.session.add(CatalogVersion(id=1, version=1))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # another worker seeded it first
+
+    # Add seed data if database is empty
+    if not User.query.first():
+        print('creating another user')
+        admin = User(
+            username="admin@example.com",
+            password=generate_password_hash("admin123", method='pbkdf2:sha256', salt_length=8),
+            is_admin=True
+        )
+        db.session.add(admin)
+
+        # Create playlists
+        chill = Playlist(
+            title="Level 1",
+            description="If you are a beginner start here!!"
+        )
+        workout = Playlist(
+            title="Level 2",
+            description="For intermediate students only"
+        )
+        db.session.add_all([chill, workout])
+        db.session.commit()
+
+        # Add songs
+        songs = [
+            Song(
+                title="Exercise 1",
+                artist="Nature Sounds",
+                playlist_id=chill.id,
+                audio_file="amharic_lesson_1.mp3"
+            ),
+            Song(
+                title="Exercise 2",
+                artist="Ambient Music",
+                playlist_id=chill.id,
+                audio_file="amharic_lesson_2.mp3"
+            ),
+            Song(
+                title="Exercise 3",
+                artist="Energy Beats",
+                playlist_id=workout.id,
+                audio_file="amharic_lesson_3.mp3"
+            ),
+            Song(
+                title="Exercise 4",
+                artist="Workout Kings",
+                playlist_id=workout.id,
+                audio_file="amharic_lesson_4.mp3"
+            )
+        ]
+        db.session.add_all(songs)
+        db.session.commit()
+
+
+@click.command('bootstrap-db')
+def bootstrap_db_command():
+    """Create missing tables and seed an empty database."""
+    bootstrap_database()
@@ -0,0 +1,127 @@
+"""In-process cache for catalog reads (playlists, songs and lesson lines).
+
+The catalog only changes through uploads, the admin views and jobs, so GET
+responses are kept in a TTL+LRU cache keyed by URL and catalog version.
+The version is a single ``catalog_version`` row: SQLAlchemy session events
+bump it in the same transaction as any write to a Playlist, Song, Lesson,
+Line or LineOffset, whichever process makes it (web workers, the job
+worker, CLI commands). Every catalog request reads the row, one
+primary-key lookup, so all processes see a write as soon as it commits.
+
+Responses carry an ETag built from the version, so clients can revalidate
+with If-None-Match and get a 304 without running the listing queries, from
+any worker behind the load balancer.
+"""
+import itertools
+from functools import wraps
+
+from flask import Response, current_app, request
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from server.cache import TTLCache
+from server.models import db, CatalogVersion, Playlist, Song, Lesson, Line, LineOffset
+
+CATALOG_MODELS = (Playlist, Song, Lesson, Line, LineOffset)
+CATALOG_ROW = 1
+
+
+def catalog_version():
+    return db.session.scalar(select(CatalogVersion.version).where(CatalogVersion.id == CATALOG_ROW)) or 0
+
+
+def catalog_etag(version):
+    return f'catalog-{version}'
+
+
+def _bump_version(session):
+    """Count a catalog write on the shared row, once per transaction"""
+    if session.info.get('catalog_dirty'):
+        return
+    session.info['catalog_dirty'] = True
+    connection = session.connection()
+    bumped = connection.execute(update(CatalogVersion).where(CatalogVersion.id == CATALOG_ROW)
+                                .values(version=CatalogVersion.version + 1))
+    if not bumped.rowcount:  # databases created before the row was seeded
+        connection.execute(insert(CatalogVersion).values(id=CATALOG_ROW, version=2))
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_catalog_writes(session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            _bump_version(session)
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_catalog_writes(orm_execute_state):
+    # Query.delete()/update() and update(Model) statements skip the flush
+    mapper = orm_execute_state.bind_mapper
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and mapper is not None \
+            and issubclass(mapper.class_, CATALOG_MODELS):
+        _bump_version(orm_execute_state.session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('catalog_dirty', False):
+        # Entries under the old version can no longer be hit; free them now
+        cache = _get_cache()
+        if cache is not None:
+            cache.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('catalog_dirty', None)
+
+
+def init_catalog_cache(app):
+    app.extensions['catalog_cache'] = TTLCache(
+        maxsize=app.config['CATALOG_CACHE_MAX_ENTRIES'],
+        ttl=app.config['CATALOG_CACHE_TTL'],
+    )
+
+
+def _get_cache():
+    try:
+        return current_app.extensions.get('catalog_cache')
+    except RuntimeError:  # no app context
+        return None
+
+
+def catalog_cached(view):
+    """Serve a catalog GET from the cache and answer If-None-Match with 304.
+
+    Unbounded streamed listings (no ``limit``) still get an ETag but are
+    not stored, so one huge playlist cannot fill the cache.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = catalog_version()
+        etag = catalog_etag(version)
+        if request.if_none_match.contains(etag):
+            return _with_validators(Response(status=304), etag)
+
+        cache = _get_cache()
+        key = (version, request.full_path)
+        cached = cache.get(key)
+        if cached is not None:
+            body, mimetype, headers = cached
+            return _with_validators(Response(body, mimetype=mimetype, headers=headers), etag)
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and (not response.is_streamed or 'limit' in request.args):
+            headers = {name: response.headers[name]
+                       for name in ('Link', 'X-Next-Cursor') if name in response.headers}
+            cache.set(key, (response.get_data(), response.mimetype, headers))
+        return _with_validators(response, etag)
+
+    return wrapper
+
+
+def _with_validators(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
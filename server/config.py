@@ -12,10 +12,134 @@ else:
     load_dotenv(dotenv_path=".env")  #
     
 
+def engine_options(database_uri, pool_size, max_overflow):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URI.
+
+    Each worker process has its own pool, so size it to the threads that
+    share it: a gunicorn gthread worker needs about one connection per
+    thread. /api/metrics/pool shows whether checkouts wait (see db_pool.py).
+    """
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    }
+    if database_uri.startswith('sqlite'):
+        # How long a connection waits for another one's write lock
+        options['connect_args'] = {'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000}
+        if ':memory:' in database_uri:
+            return options
+    else:
+        statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+        if statement_timeout:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    options.update(
+        pool_size=int(os.getenv('DB_POOL_SIZE', str(pool_size))),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', str(max_overflow))),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    )
+    return options
+
+
+def replica_binds(pool_size, max_overflow):
+    """SQLALCHEMY_BINDS with the REPLICA_DATABASE_URL read replica, if there is one.
+
+    Sized like the primary: the same request threads check out either pool.
+    """
+    replica_url = os.getenv('REPLICA_DATABASE_URL')
+    if not replica_url:
+        return {}
+    replica_url = replica_url.replace('postgres://', 'postgresql://')
+    return {'replica': {'url': replica_url, **engine_options(replica_url, pool_size, max_overflow)}}
+
+
 class Config:
     SECRET_KEY = os.getenv('SESSION_SECRET', 'dev_key')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     AUDIO_STORAGE_ROOT = os.getenv('AUDIO_STORAGE_ROOT', '/var/www/audio/')
+    # Seconds clients may reuse song audio before revalidating with ETag/Last-Modified
+    AUDIO_CACHE_MAX_AGE = int(os.getenv('AUDIO_CACHE_MAX_AGE', '0'))
+
+    # Where stored audio lives (see storage_backends.py): 'local' keeps it
+    # under AUDIO_STORAGE_ROOT, 's3' in an S3-compatible bucket with a local
+    # read-through cache of STORAGE_CACHE_MAX_BYTES
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # e.g. a local MinIO
+    S3_REGION = os.getenv('S3_REGION')
+    STORAGE_CACHE_DIR = os.getenv('STORAGE_CACHE_DIR') or os.path.join(AUDIO_STORAGE_ROOT, 'cache', 'storage')
+    STORAGE_CACHE_MAX_BYTES = int(os.getenv('STORAGE_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+
+    # Decoded line audio reused across lesson builds (see pcm_cache.py)
+    PCM_CACHE_DIR = os.getenv('PCM_CACHE_DIR') or os.path.join(AUDIO_STORAGE_ROOT, 'cache', 'pcm')
+    PCM_CACHE_MAX_BYTES = int(os.getenv('PCM_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+    LESSON_AUDIO_BITRATE = os.getenv('LESSON_AUDIO_BITRATE', '128k')
+    # Also cut built lessons into HLS segments (see hls.py)
+    LESSON_HLS_ENABLED = os.getenv('LESSON_HLS_ENABLED', 'true').lower() == 'true'
+    LESSON_HLS_SEGMENT_SECONDS = int(os.getenv('LESSON_HLS_SEGMENT_SECONDS', '6'))
+
+    # Waveform resolution stored by the analysis jobs (see audio_analysis.py)
+    AUDIO_PEAKS_PER_SECOND = int(os.getenv('AUDIO_PEAKS_PER_SECOND', '20'))
+    # Lesson builds bring every line to this level (gated RMS, dBFS)
+    LESSON_NORMALIZE = os.getenv('LESSON_NORMALIZE', 'true').lower() == 'true'
+    LESSON_LOUDNESS_TARGET_DB = float(os.getenv('LESSON_LOUDNESS_TARGET_DB', '-20'))
+    LESSON_MAX_GAIN_DB = float(os.getenv('LESSON_MAX_GAIN_DB', '12'))
+
+    # Song renditions produced by the transcode job (see transcode.py), as
+    # "name:bitrate" pairs; clients pick one with ?quality= or Accept
+    AUDIO_RENDITIONS = dict(
+        item.split(':', 1)
+        for item in os.getenv('AUDIO_RENDITIONS', 'low:64k,medium:128k,high:192k').split(',')
+    )
+
+    # Play events are buffered in memory and bulk inserted (see play_ingest.py)
+    PLAY_BUFFER_MAX_SIZE = int(os.getenv('PLAY_BUFFER_MAX_SIZE', '500'))
+    PLAY_BUFFER_FLUSH_INTERVAL = float(os.getenv('PLAY_BUFFER_FLUSH_INTERVAL', '2.0'))
+    PLAY_BUFFER_MAX_BACKLOG = int(os.getenv('PLAY_BUFFER_MAX_BACKLOG', '100000'))
+    PLAY_BATCH_MAX_SIZE = 500
+    # Oldest playedAt a batch may report, covering clients that sync after being offline
+    PLAY_MAX_BACKDATE_SECONDS = int(os.getenv('PLAY_MAX_BACKDATE_SECONDS', str(7 * 24 * 3600)))
+    # Also keep per-day totals in SongPlayDaily
+    PLAY_DAILY_ROLLUPS = os.getenv('PLAY_DAILY_ROLLUPS', 'true').lower() == 'true'
+
+    # Largest body accepted by a single PUT /api/uploads/<id> chunk
+    UPLOAD_CHUNK_MAX_BYTES = int(os.getenv('UPLOAD_CHUNK_MAX_BYTES', str(64 * 1024 * 1024)))
+    # gc-blobs expires open uploads, and scratch files, untouched for this long
+    UPLOAD_EXPIRE_SECONDS = int(os.getenv('UPLOAD_EXPIRE_SECONDS', str(24 * 3600)))
+
+    # Cached catalog reads (see catalog_cache.py)
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '30'))
+    CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', '1024'))
+
+    # Login/register hash passwords in a process pool (see password_hashing.py);
+    # stored hashes are upgraded to PASSWORD_HASH_METHOD on login. Hashes
+    # must fit User.password (120 chars), so stick to pbkdf2.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000000')
+    PASSWORD_HASH_PROCESSES = int(os.getenv('PASSWORD_HASH_PROCESSES', '0'))  # 0: one per CPU
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_WAIT_SECONDS = float(os.getenv('PASSWORD_HASH_WAIT_SECONDS', '5'))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+
+    # Signed bearer tokens next to the session cookie (see auth_tokens.py)
+    AUTH_TOKENS_ENABLED = os.getenv('AUTH_TOKENS_ENABLED', 'false').lower() == 'true'
+    AUTH_TOKEN_MAX_AGE = int(os.getenv('AUTH_TOKEN_MAX_AGE', str(7 * 24 * 3600)))
+    AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', '10000'))
+    # How stale a worker's copy of the revocation list may get
+    AUTH_REVOCATION_REFRESH = int(os.getenv('AUTH_REVOCATION_REFRESH', '10'))
+
+    # Create tables and seed an empty database in create_app (see bootstrap.py)
+    DB_BOOTSTRAP_ON_START = os.getenv('DB_BOOTSTRAP_ON_START', 'true').lower() == 'true'
+    # Import the admin CMS on the first /admin request instead of at startup
+    # (see LazyAdmin in app.py); saves ~130 ms of startup
+    ADMIN_LAZY_LOAD = os.getenv('ADMIN_LAZY_LOAD', 'false').lower() == 'true'
+
+    # Background job worker (see jobs.py); 0 processes means one per CPU
+    JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '0'))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '600'))
+    # Requeue jobs whose worker process died until they have been tried this often
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
 
     # Use Replit's PostgreSQL database URL if available
     db_url = os.getenv('DATABASE_URL')
@@ -26,6 +150,21 @@ class Config:
     else:
         # Fallback to SQLite for local development
         SQLALCHEMY_DATABASE_URI = 'sqlite:///music.db'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=5, max_overflow=10)
+
+    # Read replica for GET requests (see db_routing.py)
+    SQLALCHEMY_BINDS = replica_binds(pool_size=5, max_overflow=10)
+    REPLICA_BLUEPRINTS = os.getenv('REPLICA_BLUEPRINTS', 'playlist,song,auth').split(',')
+    # How long a client reads from the primary after writing; cover replication lag
+    REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+    REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+    # Applied to every new SQLite connection (see db_pool.py). WAL lets
+    # readers carry on while a write is in progress.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+    }
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -33,9 +172,17 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite:///test.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=5, max_overflow=10)
+    SQLALCHEMY_BINDS = replica_binds(pool_size=5, max_overflow=10)
+    PLAY_BUFFER_MAX_SIZE = 1  # write plays immediately so tests can read them back
 
 class ProductionConfig(Config):
     DEBUG = False
+    # Schema and seed data are set up at deploy time (flask bootstrap-db)
+    DB_BOOTSTRAP_ON_START = os.getenv('DB_BOOTSTRAP_ON_START', 'false').lower() == 'true'
+    # Sized for gunicorn gthread workers with up to 16 threads each
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(Config.SQLALCHEMY_DATABASE_URI, pool_size=10, max_overflow=6)
+    SQLALCHEMY_BINDS = replica_binds(pool_size=10, max_overflow=6)
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,154 @@
+"""Database connection pool set-up and metrics.
+
+Engine options come from config (see engine_options there). On top of
+those, the pool is an InstrumentedQueuePool that records how long each
+checkout waited for a free connection, and SQLite connections get
+SQLITE_PRAGMAS (WAL mode) as they are opened.
+
+The numbers are per process and exposed at ``/api/metrics/pool``. If
+``waited`` grows, or ``peakInUse`` reaches ``size + maxOverflow``,
+requests are queueing for connections and the pool (or the number of
+threads sharing it) needs resizing.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# Checkouts slower than this count as having waited for a connection
+WAIT_THRESHOLD = 0.005
+# Upper bounds, in seconds, of the wait time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new measurement window; connections in use stay counted"""
+        with self._lock:
+            self.checkouts = 0
+            self.waited = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+            self.in_use = getattr(self, 'in_use', 0)
+            self.peak_in_use = self.in_use
+
+    def checked_out(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if wait > WAIT_THRESHOLD:
+                self.waited += 1
+            self.buckets[next((i for i, bound in enumerate(WAIT_BUCKETS) if wait <= bound),
+                              len(WAIT_BUCKETS))] += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "waitAvgMs": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0,
+                "waitMaxMs": round(self.wait_max * 1000, 3),
+                # Checkouts per bucket of wait time, up to "leMs" (None: slower)
+                "waitHistogram": [{"leMs": None if bound is None else bound * 1000, "count": count}
+                                  for bound, count in zip(WAIT_BUCKETS + (None,), self.buckets)],
+                "inUse": self.in_use,
+                "peakInUse": self.peak_in_use,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeout:
+            self.metrics.timed_out()
+            raise
+        self.metrics.checked_out(time.perf_counter() - started)
+        return record
+
+    def _do_return_conn(self, record):
+        self.metrics.checked_in()
+        super()._do_return_conn(record)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def _with_pool_class(options, url):
+    options = dict(options)
+    if ':memory:' not in str(url):
+        options.setdefault('poolclass', InstrumentedQueuePool)
+    return options
+
+
+def init_db_pool(app):
+    """Use the instrumented pool for every engine; call before db.init_app"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _with_pool_class(
+        app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}), app.config['SQLALCHEMY_DATABASE_URI'])
+    # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS
+    binds = {}
+    for key, value in app.config.get('SQLALCHEMY_BINDS', {}).items():
+        options = {'url': value} if isinstance(value, str) else value
+        binds[key] = _with_pool_class(options, options['url'])
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_engine_events(app, engine):
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if engine.dialect.name == 'sqlite' and pragmas:
+        event.listen(engine, 'connect',
+                     lambda conn, record: _set_sqlite_pragmas(conn, record, pragmas))
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {"class": type(pool).__name__, "dialect": engine.dialect.name}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "maxOverflow": pool._max_overflow,
+            "timeoutSeconds": pool.timeout(),
+            "checkedOut": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
@@ -0,0 +1,136 @@
+"""Send read-only requests to a read replica.
+
+When REPLICA_DATABASE_URL is set it becomes the ``replica`` bind, and
+RoutingSession, the class of ``db.session``, runs a SELECT there if
+
+- the request is a GET or HEAD to one of REPLICA_BLUEPRINTS, or the
+  statement was marked with ``.execution_options(replica=True)`` (for
+  counts and aggregates elsewhere), and
+- this session has not written anything yet, and
+- the client is not pinned to the primary (see below).
+
+Everything else goes to the primary: writes, flushes, every query after
+a write in the same session, statements marked with
+``.execution_options(primary=True)`` (reads that must not lag, such as
+token revocations), and all work outside a request (jobs, CLI commands,
+the play buffer).
+
+Read-your-writes: a request that commits a write pins its client to the
+primary for REPLICA_PIN_SECONDS through the Flask session. That covers
+replication lag, so a user who has just recorded plays or edited a
+lesson reads them back straight away. Bearer token clients need not keep
+the session cookie, so their user is pinned as well, in memory in the
+worker that took the write. Other users may see a change that late, plus
+the catalog cache TTL.
+
+If the replica cannot be reached it is taken out of use for
+REPLICA_RETRY_SECONDS and reads go to the primary. The request that ran
+into the failure still gets its error.
+"""
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+from server.cache import TTLCache
+
+REPLICA_BIND = 'replica'
+PRIMARY = 'primary'
+PIN_SESSION_KEY = 'db_pinned_until'
+PIN_MAX_USERS = 10000
+
+
+class ReplicaHealth:
+    def __init__(self, retry_seconds):
+        self.retry_seconds = retry_seconds
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self, error):
+        with self._lock:
+            if self.available():
+                print(f"Read replica unavailable, using the primary for {self.retry_seconds}s: {error}")
+            self._down_until = time.monotonic() + self.retry_seconds
+
+
+def _token_user_id():
+    """User id of the request's bearer token, or None"""
+    from server.auth_tokens import bearer_claims  # auth_tokens imports the models, which import this module
+
+    claims = bearer_claims()
+    return claims['uid'] if claims else None
+
+
+def _pinned():
+    if flask_session.get(PIN_SESSION_KEY, 0) >= time.time():
+        return True
+    user_id = _token_user_id()
+    return user_id is not None and current_app.extensions['replica_pins'].get(user_id, False)
+
+
+def _request_reads_from_replica():
+    if not has_request_context():
+        return False
+    if 'replica_reads' not in g:
+        g.replica_reads = (
+            request.method in ('GET', 'HEAD')
+            and request.blueprint in current_app.config['REPLICA_BLUEPRINTS']
+            and not _pinned()
+        )
+    return g.replica_reads
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._read_from_replica(clause):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None and current_app.extensions['replica_health'].available():
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _read_from_replica(self, clause):
+        if self._flushing or clause is None or not getattr(clause, 'is_select', False):
+            if self._flushing or clause is not None:
+                self.info['wrote'] = True  # a write; later reads must see it
+            return False
+        if self.info.get('wrote'):
+            return False
+        options = clause.get_execution_options()
+        if options.get(PRIMARY):
+            return False
+        if options.get(REPLICA_BIND):
+            return True
+        return _request_reads_from_replica()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_after_write(session):
+    if session.info.get('wrote') and has_request_context():
+        pin_seconds = current_app.config['REPLICA_PIN_SECONDS']
+        if pin_seconds and REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {}):
+            flask_session[PIN_SESSION_KEY] = time.time() + pin_seconds
+            # Claims the request has already checked; no SQL may run here
+            claims = g.get('bearer_claims')
+            if claims:
+                current_app.extensions['replica_pins'].set(claims['uid'], True, ttl=pin_seconds)
+
+
+def init_replica(app, db):
+    """Watch the replica for connection failures; call after db.init_app"""
+    health = app.extensions['replica_health'] = ReplicaHealth(app.config['REPLICA_RETRY_SECONDS'])
+    app.extensions['replica_pins'] = TTLCache(maxsize=PIN_MAX_USERS, ttl=app.config['REPLICA_PIN_SECONDS'])
+    with app.app_context():
+        engine = db.engines.get(REPLICA_BIND)
+    if engine is None:
+        return
+
+    @event.listens_for(engine, 'handle_error')
+    def _replica_error(context):
+        # Lost connections and failures to connect, not errors in a query
+        if context.is_disconnect or context.connection is None:
+            health.mark_down(context.original_exception)
@@ -0,0 +1,115 @@
+"""Compare the streamed lesson encoder with AudioSegment concatenation.
+
+    python -m server.encode_benchmark [--clips 15 60] [--seconds 20] [--runs 1]
+
+Makes stereo WAV clips of ``--seconds`` each with ffmpeg and builds one
+lesson from them both ways, with a break after every other clip:
+
+``stream``  decode each clip to PCM and pipe it into a single ffmpeg
+            encoder (audio_pipeline.encode_pcm_stream, as build_lesson does)
+``concat``  ``combined += AudioSegment.from_file(clip)`` and export, the
+            way lessons were built before
+
+Each build runs in a fresh interpreter and reports its wall time and peak
+RSS. Only the Python process is counted, not ffmpeg.
+"""
+import argparse
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('concat', 'stream')
+
+
+def make_clips(directory, count, seconds):
+    from pydub.utils import get_encoder_name
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'clip_{i:03d}.wav')
+        subprocess.run([get_encoder_name(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', f'sine=frequency={220 + 10 * i}:duration={seconds}',
+                        '-ac', '2', '-ar', '44100', path], check=True)
+        paths.append(path)
+    return paths
+
+
+def build_concat(clips, output_path):
+    from pydub import AudioSegment
+
+    combined = AudioSegment.empty()
+    for index, path in enumerate(clips):
+        clip = AudioSegment.from_file(path)
+        combined += clip
+        if index % 2:
+            combined += AudioSegment.silent(duration=len(clip))
+    combined.export(output_path, format='mp3')
+
+
+def build_stream(clips, output_path):
+    from server.audio_pipeline import decode_pcm_chunks, encode_pcm_stream, silence_chunks
+
+    def chunks():
+        for index, path in enumerate(clips):
+            clip_size = 0
+            for chunk in decode_pcm_chunks(path):
+                clip_size += len(chunk)
+                yield chunk
+            if index % 2:
+                yield from silence_chunks(clip_size)
+
+    encode_pcm_stream(chunks(), output_path, format='mp3')
+
+
+def run_build(mode, clips):
+    """Build once in this process; prints ``seconds peak_rss_kib``"""
+    build = build_stream if mode == 'stream' else build_concat
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        build(clips, os.path.join(directory, 'lesson.mp3'))
+        elapsed = time.perf_counter() - started
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def measure(mode, clips, runs):
+    """``(seconds, peak RSS in MiB)`` for each run"""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-m', 'server.encode_benchmark', '--build', mode, *clips],
+                                cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        seconds, rss_kib = output.split()
+        results.append((float(seconds), int(rss_kib) / 1024))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clips', type=int, nargs='+', default=[15, 60],
+                        help='Lesson sizes (number of clips) to build.')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--runs', type=int, default=1)
+    parser.add_argument('--build', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build:
+        run_build(args.build, args.paths)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        all_clips = make_clips(directory, max(args.clips), args.seconds)
+        for count in args.clips:
+            print(f"{count} clips of {args.seconds:g} s, break after every other clip, {args.runs} runs")
+            for mode in MODES:
+                results = measure(mode, all_clips[:count], args.runs)
+                print(f"  {mode:6}  median {statistics.median(r[0] for r in results):6.2f} s, "
+                      f"peak RSS {max(r[1] for r in results):6.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
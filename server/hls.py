@@ -0,0 +1,67 @@
+"""Segmented (HLS) delivery of built lesson audio.
+
+When LESSON_HLS_ENABLED is set, build_lesson also cuts the lesson mp3
+into LESSON_HLS_SEGMENT_SECONDS segments plus a VOD playlist stored
+under ``hls/<sha256>/``, keyed by the mp3's blob hash. A
+player then only fetches the segments it actually plays, so start-up
+time does not depend on the length of the lesson.
+
+Because the directory name is a content hash its files never change and
+are served as immutable. ``/api/songs/<id>/hls.m3u8`` redirects to the
+song's current playlist, and gc-blobs removes directories whose blob is
+gone.
+"""
+import os
+import re
+import shutil
+
+from flask import current_app
+
+from server.audio_pipeline import segment_hls
+from server.storage_backends import get_storage
+from server import blob_store
+
+HLS_DIR = 'hls'
+MANIFEST_NAME = 'index.m3u8'
+
+_FILE_NAME = re.compile(r'index\.m3u8|seg_\d{5}\.ts')
+_SHA256 = re.compile(r'[0-9a-f]{64}')
+
+MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+
+def hls_key(sha256, name):
+    return f'{HLS_DIR}/{sha256}/{name}'
+
+
+def has_hls(sha256):
+    return bool(sha256) and get_storage().exists(hls_key(sha256, MANIFEST_NAME))
+
+
+def build_hls(audio_key):
+    """Segment a stored mp3 blob unless its segments already exist"""
+    sha256 = blob_store.blob_hash(audio_key)
+    if sha256 is None or has_hls(sha256):
+        return
+
+    output_dir = os.path.join(blob_store.temp_dir(), f'{sha256}.hls')
+    try:
+        segment_hls(blob_store.resolve_audio_path('songs', audio_key), output_dir,
+                    segment_seconds=current_app.config['LESSON_HLS_SEGMENT_SECONDS'])
+        # The playlist goes last: has_hls is true only once every segment is stored
+        names = sorted(os.listdir(output_dir), key=lambda name: name == MANIFEST_NAME)
+        storage = get_storage()
+        for name in names:
+            storage.put_file(os.path.join(output_dir, name), hls_key(sha256, name))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def hls_file(sha256, name):
+    """``(path, mimetype)`` of a playlist or segment, or None if the name is not valid"""
+    if not _SHA256.fullmatch(sha256) or not _FILE_NAME.fullmatch(name):
+        return None
+    return get_storage().local_path(hls_key(sha256, name)), MIMETYPES[os.path.splitext(name)[1]]
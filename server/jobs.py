@@ -0,0 +1,258 @@
+"""Database-backed background jobs.
+
+Jobs are rows in the ``job`` table. The admin views enqueue them and a
+worker started with ``flask run-jobs`` (or ``python -m server.jobs``)
+claims queued rows and runs them in a process pool, so long audio work
+(lesson builds, transcoding) never happens inside an HTTP request.
+
+If a worker process dies (killed for memory, a crash in ffmpeg bindings)
+the pool is broken for every job in it. The worker then starts a new pool
+and puts the jobs it had claimed back in the queue, failing a job only
+once it has been attempted JOB_MAX_ATTEMPTS times.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from server.models import db, Job
+
+
+def _handlers():
+    from server.lesson_builder import build_lesson
+    from server.transcode import transcode_song
+    from server.audio_analysis import analyze_song, analyze_line
+    return {
+        'lesson_build': build_lesson,
+        'transcode': transcode_song,
+        'analyze_song': analyze_song,
+        'analyze_line': analyze_line,
+    }
+
+
+def enqueue_job(kind, target_id):
+    """Queue a job unless an identical one is already waiting.
+
+    Returns ``(job, created)``. A job that is already running does not
+    swallow the request, because the target may have changed since it
+    started; the new job simply waits until the running one finishes.
+    Commits the session.
+    """
+    while True:
+        existing = Job.query.filter_by(kind=kind, target_id=target_id, status='queued').first()
+        if existing:
+            return existing, False
+
+        job = Job(kind=kind, target_id=target_id)
+        db.session.add(job)
+        try:
+            db.session.commit()
+            return job, True
+        except IntegrityError:
+            db.session.rollback()  # another request queued it first (uq_job_queued_kind_target)
+
+
+def latest_job(kind, target_id):
+    return (Job.query.filter_by(kind=kind, target_id=target_id)
+            .order_by(Job.id.desc())
+            .first())
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "targetId": job.target_id,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "createdAt": job.created_at.isoformat() if job.created_at else None,
+        "finishedAt": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _claimable(now):
+    """Queued jobs, plus running jobs whose worker stopped reporting"""
+    stale_before = now - timedelta(seconds=current_app.config['JOB_STALE_SECONDS'])
+    other = aliased(Job)
+    busy_target = exists().where(
+        other.kind == Job.kind,
+        other.target_id == Job.target_id,
+        other.id != Job.id,
+        other.status == 'running',
+        other.updated_at >= stale_before,
+    )
+    return and_(
+        or_(Job.status == 'queued',
+            and_(Job.status == 'running', Job.updated_at < stale_before)),
+        ~busy_target,
+    )
+
+
+def claim_jobs(limit):
+    """Atomically mark up to ``limit`` jobs as running and return their ids"""
+    now = datetime.utcnow()
+    candidates = db.session.execute(
+        select(Job.id).where(_claimable(now)).order_by(Job.id).limit(limit)
+    ).scalars().all()
+
+    claimed = []
+    for job_id in candidates:
+        # The status check in the WHERE clause makes this safe when several
+        # workers race for the same row: only one UPDATE matches.
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, _claimable(now))
+            .values(status='running', progress=0, started_at=now, updated_at=now,
+                    attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount:
+            claimed.append(job_id)
+    return claimed
+
+
+def _update_job(job_id, **values):
+    # Use a separate connection so progress reports never flush or expire
+    # objects in the session the handler is working with.
+    values['updated_at'] = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+def _requeue_job(job_id, error):
+    """Put a job whose worker process died back in the queue, or fail it"""
+    job = db.session.get(Job, job_id)
+    attempts = job.attempts if job else 0
+    db.session.commit()
+    if attempts < current_app.config['JOB_MAX_ATTEMPTS']:
+        try:
+            _update_job(job_id, status='queued', error=str(error))
+            return
+        except IntegrityError:
+            pass  # the same job was queued again meanwhile; that one will do it
+    _update_job(job_id, status='failed', error=str(error), finished_at=datetime.utcnow())
+
+
+def run_job(job_id):
+    """Run a claimed job in the current app context and record the outcome"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    handler = _handlers()[job.kind]
+    target_id = job.target_id
+    db.session.commit()
+
+    def progress(done, total):
+        _update_job(job_id, progress=int(done * 100 / total) if total else 100)
+
+    try:
+        handler(target_id, progress=progress)
+    except Exception as e:
+        db.session.rollback()
+        _update_job(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+        print(f"Job {job_id} ({job.kind} {target_id}) failed: {e}")
+    else:
+        _update_job(job_id, status='done', progress=100, error=None, finished_at=datetime.utcnow())
+        print(f"Job {job_id} ({job.kind} {target_id}) done")
+    finally:
+        db.session.remove()
+
+
+# Process pool plumbing: each worker process builds its own app (and with
+# it its own database engine) once and reuses it for every job.
+_process_app = None
+
+
+def init_process(config_name):
+    """Pool initializer: build this process's app"""
+    global _process_app
+    from server.app import create_app
+    _process_app = create_app(config_name)
+
+
+def process_app():
+    """The app of a pool process started by ``start_pool``"""
+    return _process_app
+
+
+def start_pool(processes, config_name):
+    """A process pool whose processes each run ``init_process`` once; also used by rebuild-lessons"""
+    return ProcessPoolExecutor(max_workers=processes,
+                               mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_process,
+                               initargs=(config_name,))
+
+
+def _run_in_process(job_id):
+    with process_app().app_context():
+        run_job(job_id)
+
+
+def run_worker(app, processes=None, once=False):
+    """Poll for queued jobs and feed them to a process pool until interrupted"""
+    processes = processes or app.config['JOB_WORKER_PROCESSES'] or os.cpu_count() or 1
+    poll_interval = app.config['JOB_POLL_INTERVAL']
+    config_name = app.config.get('CONFIG_NAME')
+
+    print(f"Job worker started with {processes} processes")
+    pool = start_pool(processes, config_name)
+    running = {}
+    try:
+        while True:
+            broken = False
+            for future in [f for f in running if f.done()]:
+                job_id = running.pop(future)
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    # Every job in the pool fails this way, not just the one that died
+                    broken = True
+                    with app.app_context():
+                        _requeue_job(job_id, error)
+                elif error:
+                    print(f"Job {job_id} crashed its worker process: {error}")
+                    with app.app_context():
+                        _update_job(job_id, status='failed', error=str(error), finished_at=datetime.utcnow())
+
+            if broken:
+                print("A job worker process died; starting a new pool")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = start_pool(processes, config_name)
+
+            free = processes - len(running)
+            if free:
+                with app.app_context():
+                    for job_id in claim_jobs(free):
+                        try:
+                            running[pool.submit(_run_in_process, job_id)] = job_id
+                        except BrokenProcessPool as e:
+                            # Broke since the check above; the next round replaces it
+                            _requeue_job(job_id, e)
+
+            if once and not running:
+                break
+            time.sleep(poll_interval)
+    finally:
+        pool.shutdown()
+
+
+@click.command('run-jobs')
+@click.option('--processes', type=int, default=None, help='Worker processes (defaults to the CPU count).')
+@click.option('--once', is_flag=True, help='Exit once the queue is drained.')
+def run_jobs_command(processes, once):
+    """Run the background job worker."""
+    run_worker(current_app._get_current_object(), processes=processes, once=once)
+
+
+if __name__ == '__main__':
+    from server.app import create_app
+    run_worker(create_app())
@@ -0,0 +1,175 @@
+import hashlib
+import os
+from flask import current_app
+from server.models import db, Lesson, Song, LineOffset
+from server.pcm_cache import get_pcm_cache, pcm_duration_ms
+from server.audio_pipeline import encode_pcm_stream, pcm_file_chunks, silence_chunks, apply_gain
+from server.audio_analysis import AnalysisError, analyze, line_gain
+from server import blob_store
+from server.storage_backends import get_storage
+from server.jobs import enqueue_job
+from server.hls import build_hls
+from server.mp3_frames import scan_mp3
+
+
+class LessonBuildError(Exception):
+    """Raised when a lesson cannot be built from its lines"""
+
+
+def build_lesson(lesson_id, progress=None):
+    """Concatenate a lesson's line clips into one mp3 blob and link it to a Song.
+
+    Clips are read from the decoded PCM cache, so only lines whose audio
+    changed since the last build are decoded again, and are streamed into
+    the encoder so memory use does not grow with the length of the lesson.
+
+    Each clip is scaled by the gain that brings it to
+    LESSON_LOUDNESS_TARGET_DB. Loudness is measured once per clip when it
+    is uploaded, so normalising costs one multiply per sample here.
+
+    The start and end of every line in the result are recorded as
+    LineOffset rows, so players can seek straight to a line.
+
+    ``progress`` is called as ``progress(done, total)`` after each line so
+    the job runner can report how far along the build is.
+    """
+    lesson = db.session.get(Lesson, lesson_id)
+    if lesson is None:
+        raise LessonBuildError(f"Lesson {lesson_id} not found")
+
+    lines = sorted(lesson.lines, key=lambda l: l.order)
+    if not lines:
+        raise LessonBuildError("No lines found for this lesson")
+
+    gains = _line_gains(lines) if current_app.config['LESSON_NORMALIZE'] else None
+    spans = []  # (line id, first PCM byte, end PCM byte)
+    pcm_chunks = _lesson_pcm_chunks(lines, get_pcm_cache(), progress, spans, gains)
+
+    # Export combined audio next to the blob store, then move it in
+    output_path = blob_store.temp_path('.mp3')
+    try:
+        encode_pcm_stream(pcm_chunks, output_path, format='mp3',
+                          bitrate=current_app.config['LESSON_AUDIO_BITRATE'])
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    audio_key = blob_store.ingest_file(output_path, 'mp3')
+    if current_app.config['LESSON_HLS_ENABLED']:
+        build_hls(audio_key)
+
+    # Create or update Song entry
+    if lesson.song:
+        blob_store.replace_ref(lesson.song.audio_file, audio_key)
+        lesson.song.audio_file = audio_key  # a rebuild gets a new key, so old URLs stay valid
+    else:
+        blob_store.add_ref(audio_key)
+        song = Song(title=lesson.title,
+            artist='System',
+            playlist_id=1,
+            audio_file=audio_key
+        )
+        db.session.add(song)
+        db.session.flush()  # Get song.id before commit
+        lesson.song = song
+
+    _record_line_offsets(lesson, audio_key, spans)
+    lesson.build_fingerprint = lesson_fingerprint(lines)
+    db.session.commit()
+    enqueue_job('transcode', lesson.song.id)
+    enqueue_job('analyze_song', lesson.song.id)
+    return lesson.song
+
+
+def _record_line_offsets(lesson, audio_key, spans):
+    index = scan_mp3(blob_store.resolve_audio_path('songs', audio_key))
+    LineOffset.query.filter_by(lesson_id=lesson.id).delete(synchronize_session=False)
+    for line_id, start, end in spans:
+        start_ms, end_ms = pcm_duration_ms(start), pcm_duration_ms(end)
+        db.session.add(LineOffset(
+            line_id=line_id,
+            lesson_id=lesson.id,
+            audio_file=audio_key,
+            start_ms=start_ms,
+            end_ms=end_ms,
+            start_byte=index.byte_offset(start_ms),
+            end_byte=index.byte_offset(end_ms)
+        ))
+
+
+# Settings that change the built audio; bump BUILD_VERSION when the build
+# itself changes in a way that should invalidate existing fingerprints
+BUILD_VERSION = 1
+_BUILD_SETTINGS = ('LESSON_AUDIO_BITRATE', 'LESSON_NORMALIZE', 'LESSON_LOUDNESS_TARGET_DB',
+                   'LESSON_MAX_GAIN_DB', 'LESSON_HLS_ENABLED', 'LESSON_HLS_SEGMENT_SECONDS')
+
+
+def lesson_fingerprint(lines):
+    """Hash of everything a build reads, so unchanged lessons can be skipped.
+
+    Blob keys already name the clip content; legacy file names add the
+    storage backend's version of the file (size and mtime on disk, size and
+    ETag on S3) since those files can be replaced in place.
+    """
+    storage = get_storage()
+    digest = hashlib.sha256(f'v{BUILD_VERSION}'.encode())
+    for name in _BUILD_SETTINGS:
+        digest.update(f'|{name}={current_app.config[name]}'.encode())
+    for line in sorted(lines, key=lambda l: l.order):
+        digest.update(f'|{line.id}:{line.audio_file}:{bool(line.break_after)}'.encode())
+        if line.audio_file and not blob_store.is_blob_key(line.audio_file):
+            version = storage.version(blob_store.audio_url_path('lines', line.audio_file))
+            if version is not None:
+                digest.update(f':{version}'.encode())
+    return digest.hexdigest()
+
+
+def is_up_to_date(lesson):
+    """Whether the lesson's built song still matches its lines and settings"""
+    if not lesson.build_fingerprint or lesson.song is None:
+        return False
+    if not get_storage().exists(blob_store.audio_url_path('songs', lesson.song.audio_file)):
+        return False
+    return lesson.build_fingerprint == lesson_fingerprint(lesson.lines)
+
+
+def _line_gains(lines):
+    """Gain per line id from the stored loudness, measuring any clip that has none"""
+    try:
+        return {line.id: line_gain(analyze('lines', line.audio_file))
+                for line in lines if line.audio_file}
+    except AnalysisError as e:
+        raise LessonBuildError(str(e)) from e
+
+
+def _lesson_pcm_chunks(lines, pcm_cache, progress=None, spans=None, gains=None):
+    """Yield the lesson's PCM line by line, straight from the decoded cache.
+
+    Each clip's ``(line id, start, end)`` PCM byte range is appended to ``spans``.
+    """
+    position = 0
+    for index, line in enumerate(lines, start=1):
+        if line.audio_file:
+            audio_path = blob_store.resolve_audio_path('lines', line.audio_file)
+            if not os.path.exists(audio_path):
+                raise LessonBuildError(f"Missing file: {line.audio_file}")
+
+            if os.path.getsize(audio_path) < 1000:
+                raise LessonBuildError(f"Audio file {line.audio_file} is too small or empty.")
+
+            gain = gains.get(line.id, 1.0) if gains else 1.0
+            clip_size = 0
+            cached = pcm_cache.get(audio_path, content_hash=blob_store.blob_hash(line.audio_file))
+            for chunk in pcm_file_chunks(cached):
+                clip_size += len(chunk)
+                yield apply_gain(chunk, gain)  # no silence, no fade
+            if spans is not None:
+                spans.append((line.id, position, position + clip_size))
+            position += clip_size
+
+            if getattr(line, 'break_after', False):  # check break_after attribute
+                yield from silence_chunks(clip_size)  # silence same length as clip
+                position += clip_size
+
+        if progress:
+            progress(index, len(lines))
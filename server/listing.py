@@ -0,0 +1,108 @@
+"""Keyset-paginated, column-projected JSON listings.
+
+Listing endpoints select only the columns a client asked for (``fields=``)
+as plain rows instead of ORM objects, page with ``limit``/``cursor`` on the
+primary key, and stream the JSON array out in chunks. Without ``limit`` the
+whole listing is streamed from a server-side cursor, so even very large
+playlists never sit in memory at once. A field can also be a Derived
+value, computed per row from columns selected for it.
+
+The response body stays a plain JSON array. When there is another page its
+cursor is sent in the ``X-Next-Cursor`` header and a ``Link: rel="next"``.
+"""
+from flask import Response, abort, current_app, request, stream_with_context, url_for
+from sqlalchemy import select
+
+from server.models import db
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+FLUSH_BYTES = 64 * 1024
+
+
+class Derived:
+    """A listing field computed in Python from ``columns`` of each row"""
+
+    def __init__(self, compute, *columns):
+        self.compute = compute
+        self.columns = columns
+
+
+def keyset_listing(fields_map, id_column, *criteria):
+    """Stream rows matching ``criteria`` as a JSON array of ``fields_map`` keys"""
+    fields = _requested_fields(fields_map)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', type=int)
+
+    columns = [id_column.label('_cursor')]
+    for name in fields:
+        field = fields_map[name]
+        if isinstance(field, Derived):
+            columns += [column.label(f'_{name}_{i}') for i, column in enumerate(field.columns)]
+        else:
+            columns.append(field.label(name))
+    stmt = select(*columns).where(*criteria).order_by(id_column)
+    if cursor is not None:
+        stmt = stmt.where(id_column > cursor)
+
+    headers = {}
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        rows = db.session.execute(stmt.limit(limit + 1)).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]._cursor
+            args = request.args.to_dict()
+            args['cursor'] = next_cursor
+            headers['X-Next-Cursor'] = str(next_cursor)
+            headers['Link'] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    else:
+        rows = db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+    return Response(stream_with_context(_json_array(rows, _getters(fields_map, fields))),
+                    mimetype='application/json', headers=headers)
+
+
+def _requested_fields(fields_map):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(fields_map)
+
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in fields_map]
+    if unknown or not fields:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}. "
+                               f"Allowed: {', '.join(fields_map)}")
+    return fields
+
+
+def _getters(fields_map, fields):
+    """``{name: function(row)}`` reading each field from a result row"""
+    def getter(name):
+        field = fields_map[name]
+        if not isinstance(field, Derived):
+            return lambda row: getattr(row, name)
+        labels = [f'_{name}_{i}' for i in range(len(field.columns))]
+        return lambda row: field.compute(*(getattr(row, label) for label in labels))
+
+    return {name: getter(name) for name in fields}
+
+
+def _json_array(rows, getters):
+    dumps = current_app.json.dumps
+    buffer = ['[']
+    size = 1
+    first = True
+    for row in rows:
+        item = dumps({name: get(row) for name, get in getters.items()})
+        if not first:
+            buffer.append(',')
+        buffer.append(item)
+        first = False
+        size += len(item) + 1
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(']')
+    yield ''.join(buffer)
@@ -0,0 +1,141 @@
+"""Login burst load test: how logins and other requests fare at class start.
+
+    python -m server.login_load_test [--logins 24] [--workers 2] [--threads 16] [--rounds 2]
+
+Seeds a fresh SQLite database with users ``u0``, ``u1``, ... (password
+``pw``, hashed with PASSWORD_HASH_METHOD), starts gunicorn with gthread
+workers on it, then fires ``--logins`` POST /api/login at once while a
+probe requests /api/user every 50 ms. Reports the status codes, login
+latency and the latency of the probe's requests, which stand in for
+everything else the workers should keep serving.
+
+PASSWORD_HASH_* settings are read from the environment as usual, e.g.
+PASSWORD_HASH_MAX_PENDING=4 PASSWORD_HASH_WAIT_SECONDS=2 to see requests
+shed with 503 instead of queueing. ``--url`` runs against a server that
+is already up and has those users instead.
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBE_INTERVAL = 0.05
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else float('nan')
+
+
+def request(url, method, path, body=None):
+    """``(status, seconds)``"""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=300)
+    started = time.perf_counter()
+    connection.request(method, path, body=json.dumps(body) if body else None,
+                       headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status, time.perf_counter() - started
+
+
+def seed_users(count):
+    from server.app import create_app
+    from server.models import db, User
+    from werkzeug.security import generate_password_hash
+
+    app = create_app('testing')
+    with app.app_context():
+        pwhash = generate_password_hash('pw', app.config['PASSWORD_HASH_METHOD'], 16)
+        db.session.add_all([User(username=f'u{i}', password=pwhash) for i in range(count)])
+        db.session.commit()
+
+
+def start_server(port, workers, threads):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-k', 'gthread', '-w', str(workers), '--threads', str(threads),
+         '-b', f'127.0.0.1:{port}', "server.app:create_app('testing')"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if request(f'http://127.0.0.1:{port}', 'GET', '/api/test')[0] == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def burst(url, logins):
+    probes = []
+    done = threading.Event()
+
+    def probe():
+        while not done.is_set():
+            probes.append(request(url, 'GET', '/api/user')[1])
+            time.sleep(PROBE_INTERVAL)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(logins) as pool:
+        results = list(pool.map(
+            lambda i: request(url, 'POST', '/api/login', {'username': f'u{i}', 'password': 'pw'}),
+            range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    prober.join()
+
+    codes = {}
+    for status, _ in results:
+        codes[status] = codes.get(status, 0) + 1
+    ok = [seconds for status, seconds in results if status == 200]
+    print(f"  codes {codes}, wall {elapsed:.1f} s, "
+          f"login p50 {_percentile(ok, 0.5):.2f} s p99 {_percentile(ok, 0.99):.2f} s, "
+          f"other requests p50 {_percentile(probes, 0.5) * 1000:.0f} ms "
+          f"p99 {_percentile(probes, 0.99) * 1000:.0f} ms (n={len(probes)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=24)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--url', help='Test a running server instead of starting one.')
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"{args.logins} concurrent logins against {args.url}")
+        for _ in range(args.rounds):
+            burst(args.url, args.logins)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(directory, 'logins.db')}")
+        os.environ.setdefault('AUDIO_STORAGE_ROOT', os.path.join(directory, 'audio'))
+        seed_users(args.logins)
+        server = start_server(args.port, args.workers, args.threads)
+        try:
+            print(f"{args.logins} concurrent logins, gunicorn gthread {args.workers} workers x "
+                  f"{args.threads} threads, {os.cpu_count()} CPUs")
+            for _ in range(args.rounds):
+                burst(f'http://127.0.0.1:{args.port}', args.logins)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from flask import Blueprint, jsonify, request
+from server.models import db, User
+from server.auth_tokens import bearer_claims, current_user_id
+from server.db_pool import pool_status
+from server.db_routing import REPLICA_BIND
+
+metrics_bp = Blueprint('metrics', __name__)
+
+def _is_admin():
+    claims = bearer_claims()
+    if claims is not None:
+        return claims['admin']
+    user_id = current_user_id()
+    user = db.session.get(User, user_id) if user_id else None
+    return bool(user and user.is_admin)
+
+@metrics_bp.route('/api/metrics/pool', methods=['GET'])
+def get_pool_metrics():
+    """Connection pool state and checkout wait times of this worker process.
+
+    The read replica's pool, if there is one, is under ``replica``.
+    ``?reset=1`` starts a new measurement window.
+    """
+    if not _is_admin():
+        return jsonify({"error": "Admin only"}), 403
+
+    status = pool_status(db.engine)
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is not None:
+        status['replica'] = pool_status(replica)
+    if request.args.get('reset'):
+        for engine in db.engines.values():
+            metrics = getattr(engine.pool, 'metrics', None)
+            if metrics is not None:
+                metrics.reset()
+    return jsonify(status)
@@ -1,41 +1,244 @@
+"""Move song and line audio into the blob store, in bulk.
 
+    flask migrate-storage [--kind songs|lines|all] [--source DIR ...]
+                          [--move] [--workers N] [--batch-size N]
+                          [--restart] [--no-verify]
+
+Rows are read in id order one page of ``--batch-size`` at a time, and only
+their id and audio_file are loaded, so memory stays flat however large the
+catalog is. Each file is found in the ``--source`` directories, the
+legacy ``AUDIO_STORAGE_ROOT/<kind>`` directory or (for songs) the old
+``server/storage/audio`` upload directory. A thread pool copies it onto
+the configured storage while hashing it. Unless ``--no-verify`` is given, the copy
+is read back and its SHA-256 compared before anything points at it.
+
+Rows that already use blob keys are copied too if their blob is missing
+under the current root. That moves an entire store: point
+AUDIO_STORAGE_ROOT at the new volume and pass the old root as ``--source``.
+
+Every page is committed on its own and the last migrated id is saved to
+``AUDIO_STORAGE_ROOT/cache/migrate-storage.json``, so a crashed run picks
+up where it stopped. ``--move`` deletes source files once their page has
+been committed.
+"""
+import hashlib
 import os
-from flask import Flask
-from models import db, Song
-from config import config
-import shutil
-
-def migrate_db():
-    """Migrate from storing audio in database to filesystem"""
-    app = Flask(__name__)
-    app.config.from_object(config['development'])
-    db.init_app(app)
-    
-    with app.app_context():
-        # Ensure storage directory exists
-        storage_dir = os.path.join(os.path.dirname(__file__), 'storage', 'audio')
-        os.makedirs(storage_dir, exist_ok=True)
-        
-        # Get all songs with audio_data
-        songs = Song.query.all()
-        print(f"Found {len(songs)} songs to migrate")
-        
-        for song in songs:
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from sqlalchemy import select, update
+
+from server.models import db, Song, Line, AudioRendition, AudioAnalysis, LineOffset
+from server.storage_backends import get_storage
+from server import blob_store, run_state
+
+READ_SIZE = 1024 * 1024
+MAX_LOGGED_MISSING = 1000
+
+# Where uploads were written before AUDIO_STORAGE_ROOT existed
+LEGACY_UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'storage', 'audio')
+
+MODELS = {'songs': Song, 'lines': Line}
+
+
+class ChecksumError(Exception):
+    """Raised when a copied file does not read back with the source's hash"""
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_with_checksum(source, target, verify=True):
+    """Copy ``source`` to ``target`` and return ``(sha256, size)``"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        for chunk in iter(lambda: src.read(READ_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+            size += len(chunk)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+    sha256 = digest.hexdigest()
+    if verify and _file_digest(target) != sha256:
+        os.remove(target)
+        raise ChecksumError(f"Copy of {source} does not match the original")
+    return sha256, size
+
+
+def _candidates(kind, name, sources):
+    root = current_app.config['AUDIO_STORAGE_ROOT']
+    if blob_store.is_blob_key(name):
+        return [os.path.join(source, name) for source in sources]
+    dirs = list(sources) + [os.path.join(root, kind)]
+    if kind == 'songs':
+        dirs.append(LEGACY_UPLOAD_DIR)
+    return [os.path.join(directory, name) for directory in dirs]
+
+
+def _find_source(kind, name, sources):
+    """Path the row's audio should be copied from, or None if it is already in place"""
+    if blob_store.is_blob_key(name) and get_storage().exists(name):
+        return None
+    for path in _candidates(kind, name, sources):
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError(name)
+
+
+def _repoint(kind, row_id, old, new):
+    """Point the row, and everything derived from its old name, at the new key"""
+    model = MODELS[kind]
+    result = db.session.execute(
+        update(model)
+        .where(model.id == row_id, model.audio_file == old)
+        .values(audio_file=new)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        return False  # changed while we were copying; leave it alone
+
+    if kind == 'songs':
+        # Same bytes under a new name: renditions and line offsets still apply
+        db.session.execute(update(AudioRendition)
+                           .where(AudioRendition.song_id == row_id, AudioRendition.source == old)
+                           .values(source=new).execution_options(synchronize_session=False))
+        db.session.execute(update(LineOffset)
+                           .where(LineOffset.audio_file == old)
+                           .values(audio_file=new).execution_options(synchronize_session=False))
+
+    old_key, new_key = blob_store.audio_url_path(kind, old), blob_store.audio_url_path(kind, new)
+    analysis = db.session.get(AudioAnalysis, old_key)
+    if analysis is not None:
+        if db.session.get(AudioAnalysis, new_key) is None:
+            db.session.execute(update(AudioAnalysis)
+                               .where(AudioAnalysis.audio_file == old_key)
+                               .values(audio_file=new_key).execution_options(synchronize_session=False))
+        else:
+            db.session.delete(analysis)
+    return True
+
+
+def migrate_kind(kind, sources, pool, state, state_path, batch_size, move, verify):
+    model = MODELS[kind]
+    last_id = state['lastId'].get(kind, 0)
+    total = db.session.scalar(select(db.func.count()).select_from(model)
+                              .where(model.audio_file.isnot(None), model.audio_file != '', model.id > last_id))
+    seen = copied = copied_bytes = 0
+    started = time.perf_counter()
+
+    while True:
+        page = db.session.execute(
+            select(model.id, model.audio_file)
+            .where(model.audio_file.isnot(None), model.audio_file != '', model.id > last_id)
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not page:
+            break
+
+        pending = []
+        for row_id, name in page:
             try:
-                if hasattr(song, 'audio_data') and song.audio_data:
-                    # Write audio data to file
-                    file_path = os.path.join(storage_dir, song.audio_file)
-                    with open(file_path, 'wb') as f:
-                        f.write(song.audio_data)
-                    print(f"Migrated song: {song.title}")
-            except Exception as e:
-                print(f"Error migrating song {song.title}: {e}")
-                
-        print("Migration completed!")
-        
-        # Now, let's update the database schema - this is already handled by SQLAlchemy
-        # when you remove the column from the model and run db.create_all()
+                source = _find_source(kind, name, sources)
+            except FileNotFoundError:
+                if len(state['missing']) < MAX_LOGGED_MISSING:
+                    state['missing'].append(f'{kind}/{row_id}: {name}')
+                state['missingCount'] += 1
+                continue
+            if source is None:
+                continue
+            target = blob_store.temp_path()
+            pending.append((row_id, name, source, target, pool.submit(copy_with_checksum, source, target, verify)))
 
-if __name__ == "__main__":
-    migrate_db()
+        moved_sources = []
+        try:
+            for row_id, name, source, target, future in pending:
+                sha256, size = future.result()
+                key = blob_store.ingest_file(target, blob_store.file_extension(name), sha256=sha256)
+                if key == name or _repoint(kind, row_id, name, key):
+                    moved_sources.append(source)
+                    copied += 1
+                    copied_bytes += size
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            for *_, target, future in pending:
+                if not future.cancel():
+                    future.exception()  # wait so the copy cannot recreate the file
+                if os.path.exists(target):
+                    os.remove(target)
+            raise
+
+        if move:
+            for source in set(moved_sources):
+                if os.path.exists(source):
+                    os.remove(source)
+
+        last_id = page[-1][0]
+        seen += len(page)
+        state['lastId'][kind] = last_id
+        run_state.save_state(state_path, state)
 
+        elapsed = time.perf_counter() - started
+        print(f"[{kind}] {seen}/{total} rows, {copied} files, "
+              f"{copied_bytes / 1024 / 1024:.1f} MiB at {copied_bytes / 1024 / 1024 / max(elapsed, 1e-6):.1f} MiB/s, "
+              f"{state['missingCount']} missing")
+
+    return copied, copied_bytes
+
+
+@click.command('migrate-storage')
+@click.option('--kind', type=click.Choice(['songs', 'lines', 'all']), default='all', show_default=True)
+@click.option('--source', 'sources', multiple=True, type=click.Path(file_okay=False),
+              help='Directory to look for audio in first (repeatable).')
+@click.option('--move', is_flag=True, help='Delete source files once they are migrated.')
+@click.option('--workers', type=int, default=8, show_default=True, help='Copy threads.')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='Rows per page and commit.')
+@click.option('--restart', is_flag=True, help='Ignore the saved position and start from the first row.')
+@click.option('--no-verify', is_flag=True, help='Skip reading copies back to check their hash.')
+def migrate_storage_command(kind, sources, move, workers, batch_size, restart, no_verify):
+    """Copy or move song and line audio into the blob store."""
+    state_path = run_state.state_path('migrate-storage')
+    state = None if restart else run_state.load_state(state_path)
+    if state is None:
+        state = {"lastId": {}, "missing": [], "missingCount": 0}
+    elif state['lastId']:
+        print(f"Resuming after {state['lastId']}")
+
+    kinds = ['songs', 'lines'] if kind == 'all' else [kind]
+    started = time.perf_counter()
+    copied = copied_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name in kinds:
+            files, size = migrate_kind(name, sources, pool, state, state_path,
+                                       batch_size, move, not no_verify)
+            copied += files
+            copied_bytes += size
+
+    blob_store.recount_refs()
+    elapsed = time.perf_counter() - started
+    print(f"Migrated {copied} files ({copied_bytes / 1024 / 1024:.1f} MiB) in {elapsed:.1f}s, "
+          f"{state['missingCount']} missing")
+    for entry in state['missing'][:20]:
+        print(f"  missing {entry}")
+
+    if not state['missingCount']:
+        run_state.clear_state(state_path)
+    else:
+        print(f"Missing files are listed in {state_path}; "
+              f"run again with --restart once they have been found")
+
+
+if __name__ == "__main__":
+    from server.app import create_app
+    with create_app().app_context():
+        migrate_storage_command()
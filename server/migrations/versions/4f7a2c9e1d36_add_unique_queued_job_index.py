@@ -0,0 +1,34 @@
+"""Add unique index on queued jobs
+
+Revision ID: 4f7a2c9e1d36
+Revises: 9b5e2d7c4a18
+Create Date: 2026-10-18 23:41:12.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f7a2c9e1d36'
+down_revision = '9b5e2d7c4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop queued duplicates left by earlier enqueue races, keeping the oldest
+    op.execute(
+        "DELETE FROM job WHERE status = 'queued' AND id NOT IN "
+        "(SELECT min_id FROM (SELECT MIN(id) AS min_id FROM job WHERE status = 'queued' "
+        "GROUP BY kind, target_id) AS keep)"
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index('uq_job_queued_kind_target', ['kind', 'target_id'], unique=True,
+                              sqlite_where=sa.text("status = 'queued'"),
+                              postgresql_where=sa.text("status = 'queued'"))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('uq_job_queued_kind_target')
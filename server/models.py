@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from server.db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Models
 class User(db.Model):
@@ -23,20 +24,34 @@ class Song(db.Model):
     playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False)
     audio_file = db.Column(db.String(255), nullable=False)  # Now stores the relative path to the file
 
+    __table_args__ = (
+        db.Index('ix_song_playlist_id_id', 'playlist_id', 'id'),
+    )
+
 class PlayHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False)
     played_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_play_history_song_id_played_at', 'song_id', 'played_at'),
+        db.Index('ix_play_history_user_id_played_at', 'user_id', 'played_at'),
+    )
+
 class Lesson(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=True)
+    build_fingerprint = db.Column(db.String(64))  # inputs of the last successful build
 
     lines = db.relationship('Line', backref='lesson', cascade="all, delete-orphan")
     song = db.relationship('Song', backref='lesson', uselist=False)
 
+    __table_args__ = (
+        db.Index('ix_lesson_song_id', 'song_id'),
+    )
+
 class Line(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
@@ -44,3 +59,118 @@ class Line(db.Model):
     lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id'), nullable=False)
     order = db.Column(db.Integer, default=0)
     break_after = db.Column(db.Boolean, default=False)
+
+    __table_args__ = (
+        db.Index('ix_line_lesson_id_order', 'lesson_id', 'order'),
+    )
+
+class LineOffset(db.Model):
+    """Where a line's clip sits inside its lesson's built audio"""
+    line_id = db.Column(db.Integer, db.ForeignKey('line.id', ondelete='CASCADE'), primary_key=True)
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id', ondelete='CASCADE'), nullable=False)
+    audio_file = db.Column(db.String(255), nullable=False)  # the build these offsets belong to
+    start_ms = db.Column(db.Integer, nullable=False)
+    end_ms = db.Column(db.Integer, nullable=False)
+    start_byte = db.Column(db.BigInteger, nullable=False)
+    end_byte = db.Column(db.BigInteger, nullable=False)  # exclusive
+
+    __table_args__ = (
+        db.Index('ix_line_offset_lesson_id', 'lesson_id'),
+    )
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # percent
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_kind_target_status', 'kind', 'target_id', 'status'),
+        db.Index('ix_job_status_id', 'status', 'id'),
+        # At most one queued job per target, however many requests race to enqueue it
+        db.Index('uq_job_queued_kind_target', 'kind', 'target_id', unique=True,
+                 sqlite_where=db.text("status = 'queued'"), postgresql_where=db.text("status = 'queued'")),
+    )
+
+class SongPlayCount(db.Model):
+    """Running total of PlayHistory rows per song, maintained on ingestion"""
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class SongPlayDaily(db.Model):
+    """Per-song play totals for each UTC day"""
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class SongUpload(db.Model):
+    """A resumable upload that becomes a Song once it is committed"""
+    id = db.Column(db.String(32), primary_key=True)
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False)
+    title = db.Column(db.String(120), nullable=False)
+    artist = db.Column(db.String(120), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # unique name of the partial file
+    size = db.Column(db.BigInteger)  # expected total size, if the client announced it
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    sha256 = db.Column(db.String(64))
+    status = db.Column(db.String(20), nullable=False, default='open')  # open, committing, committed, expired
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class AudioRendition(db.Model):
+    """A transcoded copy of a song's audio at one of AUDIO_RENDITIONS"""
+    id = db.Column(db.Integer, primary_key=True)
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False)
+    quality = db.Column(db.String(20), nullable=False)  # low, medium, high
+    source = db.Column(db.String(255), nullable=False)  # song.audio_file it was made from
+    audio_file = db.Column(db.String(255), nullable=False)  # blob key
+    format = db.Column(db.String(10), nullable=False)
+    bitrate = db.Column(db.Integer, nullable=False)  # bits per second
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('song_id', 'quality', name='uq_audio_rendition_song_quality'),
+    )
+
+class AudioAnalysis(db.Model):
+    """Duration and waveform peaks of one stored audio file"""
+    audio_file = db.Column(db.String(255), primary_key=True)  # path below AUDIO_STORAGE_ROOT
+    duration_ms = db.Column(db.Integer, nullable=False)
+    peaks_per_second = db.Column(db.Integer, nullable=False)
+    peaks = db.Column(db.LargeBinary, nullable=False)  # interleaved (min, max) int8 pairs
+    loudness_db = db.Column(db.Float)  # gated RMS in dBFS; None for silence
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class AudioBlob(db.Model):
+    """A stored audio file, addressed by the SHA-256 of its content"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    ext = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class CatalogVersion(db.Model):
+    """Single row counting catalog writes; catalog ETags and cache keys derive from it"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+class RevokedToken(db.Model):
+    """A bearer token revoked before its expiry (see auth_tokens.py)"""
+    jti = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)  # safe to delete after this
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_revoked_token_expires_at', 'expires_at'),
+    )
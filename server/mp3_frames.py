@@ -0,0 +1,104 @@
+"""Minimal MP3 frame scanner for mapping playback time to byte offsets.
+
+Only frame headers are parsed. That is enough to know where each frame
+starts, and every frame holds a fixed number of samples, so a time
+resolves to the byte offset of the frame that contains it.
+"""
+import mmap
+import os
+
+# Bitrates in kbit/s, indexed by [MPEG-1?][layer][index]
+_BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    },
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_LAYERS = {1: 3, 2: 2, 3: 1}  # header bits -> layer
+
+
+class MP3Index:
+    """Frame start offsets of an MP3 file"""
+
+    def __init__(self, offsets, end, samples_per_frame, sample_rate):
+        self.offsets = offsets
+        self.end = end  # byte just past the last frame
+        self.samples_per_frame = samples_per_frame
+        self.sample_rate = sample_rate
+
+    def byte_offset(self, ms):
+        """Offset of the frame that is playing ``ms`` milliseconds in"""
+        if not self.offsets:
+            return 0
+        frame = int(ms * self.sample_rate / 1000) // self.samples_per_frame
+        if frame >= len(self.offsets):
+            return self.end
+        return self.offsets[frame]
+
+
+def _parse_header(header):
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x3  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = _LAYERS.get((header[1] >> 1) & 0x3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x3
+    if version == 1 or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x1
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 1152 if layer == 2 or mpeg1 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def _id3v2_size(head):
+    if head[:3] != b'ID3' or len(head) < 10:
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    return size + 10 + (10 if head[5] & 0x10 else 0)
+
+
+def scan_mp3(path):
+    """Index the audio frames of an MP3 file, skipping ID3 and Xing/Info frames"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return MP3Index([], 0, 1152, 44100)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _scan(data)
+
+
+def _scan(data):
+    pos = _id3v2_size(data[:10])
+    offsets = []
+    samples_per_frame = 1152
+    sample_rate = 44100
+
+    while pos + 4 <= len(data):
+        parsed = _parse_header(data[pos:pos + 4])
+        if parsed is None:
+            if offsets:
+                break  # trailing tags or garbage
+            pos += 1  # resync before the first frame
+            continue
+        length, samples_per_frame, sample_rate = parsed
+        if pos + length > len(data):
+            break
+        # The encoder's Xing/Info header frame carries no audio
+        if offsets or not (b'Xing' in data[pos:pos + 64] or b'Info' in data[pos:pos + 64]):
+            offsets.append(pos)
+        pos += length
+
+    return MP3Index(offsets, pos, samples_per_frame, sample_rate)
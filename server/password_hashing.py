@@ -0,0 +1,114 @@
+"""Password hashing off the request threads.
+
+PBKDF2 is deliberately slow (PASSWORD_HASH_METHOD, a million SHA-256
+rounds by default), so hashing in the request thread lets a burst of
+logins at class start tie up every worker. Hashes are computed in a
+small process pool instead; the request only waits for the result. At
+most PASSWORD_HASH_MAX_PENDING hashes may be queued or running per
+process. Anything beyond that waits up to PASSWORD_HASH_WAIT_SECONDS for
+a slot and then fails with HashingBusy, which the auth routes turn into
+a 503 rather than letting the queue grow.
+
+Stored hashes made with a different method, cost or a short salt are
+upgraded the next time their user logs in (see needs_rehash).
+
+``login_user_cache`` keeps ``username -> (id, password hash)`` for
+USER_CACHE_TTL seconds, so repeated logins skip the user lookup.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from server.cache import TTLCache
+
+SALT_LENGTH = 16
+
+
+class HashingBusy(Exception):
+    """Raised when no hashing slot frees up in time"""
+
+
+def _normalize_method(method):
+    # 'pbkdf2:sha256' means werkzeug's default iteration count
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2' and len(parts) == 2:
+        parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join(parts)
+
+
+class PasswordHasher:
+    def __init__(self, method, processes, max_pending, wait_seconds):
+        self.method = method
+        self.processes = processes or os.cpu_count() or 1
+        self.wait_seconds = wait_seconds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self, broken=None):
+        # Started on first use so CLI commands never spawn it
+        with self._pool_lock:
+            if self._pool is None or self._pool is broken:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            raise HashingBusy()
+        try:
+            pool = self._get_pool()
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A pool process died (e.g. OOM killed); start a new pool once
+                return self._get_pool(broken=pool).submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, SALT_LENGTH)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        method, _, rest = pwhash.partition('$')
+        salt = rest.partition('$')[0]
+        return _normalize_method(method) != _normalize_method(self.method) or len(salt) < SALT_LENGTH
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def init_password_hasher(app):
+    hasher = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        processes=app.config['PASSWORD_HASH_PROCESSES'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+        wait_seconds=app.config['PASSWORD_HASH_WAIT_SECONDS'],
+    )
+    app.extensions['password_hasher'] = hasher
+    app.extensions['login_user_cache'] = TTLCache(
+        maxsize=app.config['USER_CACHE_MAX_ENTRIES'],
+        ttl=app.config['USER_CACHE_TTL'],
+    )
+    atexit.register(hasher.shutdown)
+    return hasher
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def login_user_cache():
+    return current_app.extensions['login_user_cache']
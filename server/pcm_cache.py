@@ -0,0 +1,117 @@
+"""Content-addressed cache of decoded line audio.
+
+Each source clip is decoded once into raw PCM in a fixed sample format and
+stored under a key derived from the file's content hash and that format,
+so a fresh download of the same clip from remote storage still hits. Lesson
+rebuilds then only decode lines whose audio changed and read everything
+else straight from the cache. Entries are evicted least recently
+used first once the cache grows past its disk budget.
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import current_app
+
+# Every cached clip is normalized to this format so clips can be spliced
+# together byte for byte.
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2  # bytes, signed little-endian
+SAMPLE_FORMAT = f's{SAMPLE_WIDTH * 8}le-{SAMPLE_RATE}hz-{CHANNELS}ch'
+FRAME_SIZE = CHANNELS * SAMPLE_WIDTH
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def decode_to_pcm(path):
+    """Decode any supported audio file to raw PCM bytes in SAMPLE_FORMAT"""
+    from pydub import AudioSegment
+    segment = (AudioSegment.from_file(path)
+               .set_frame_rate(SAMPLE_RATE)
+               .set_channels(CHANNELS)
+               .set_sample_width(SAMPLE_WIDTH))
+    return segment.raw_data
+
+
+def pcm_duration_ms(num_bytes):
+    return num_bytes // FRAME_SIZE * 1000 // SAMPLE_RATE
+
+
+class PCMCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key_for(self, path, content_hash=None):
+        """Cache key of ``path``; pass ``content_hash`` when it is known (blob keys) to skip hashing"""
+        content_hash = content_hash or file_sha256(path)
+        return hashlib.sha256(f'{content_hash}:{SAMPLE_FORMAT}'.encode()).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.pcm')
+
+    def get(self, path, content_hash=None):
+        """Return the path of the cached PCM for ``path``, decoding it on a miss"""
+        cached = self.path_for(self.key_for(path, content_hash))
+        try:
+            os.utime(cached)  # mark as recently used
+            return cached
+        except FileNotFoundError:
+            pass
+
+        pcm = decode_to_pcm(path)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        # Write to a temp file and rename so concurrent builds never read a
+        # half-written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(pcm)
+            os.replace(tmp_path, cached)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.evict(keep=cached)
+        return cached
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits its budget"""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith('.pcm'):
+                    continue
+                entry = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(entry)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            try:
+                os.remove(entry)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_pcm_cache():
+    return PCMCache(current_app.config['PCM_CACHE_DIR'], current_app.config['PCM_CACHE_MAX_BYTES'])
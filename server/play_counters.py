@@ -0,0 +1,65 @@
+"""Pre-aggregated play counters.
+
+PlayHistory keeps every listen, but the app only ever shows totals, so
+SongPlayCount (and optionally SongPlayDaily) is incremented in the same
+transaction that inserts the history rows. Reads are then a primary key
+lookup instead of a COUNT(*) over the history table.
+"""
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from server.models import db, SongPlayCount, SongPlayDaily
+
+
+def increment_play_counts(rows):
+    """Add a batch of PlayHistory rows (dicts) to the counters; the caller commits"""
+    totals = Counter(row["song_id"] for row in rows)
+    _increment(SongPlayCount, ['song_id'],
+               [{"song_id": song_id, "count": count} for song_id, count in totals.items()])
+
+    if current_app.config['PLAY_DAILY_ROLLUPS']:
+        daily = Counter((row["song_id"], row["played_at"].date()) for row in rows)
+        _increment(SongPlayDaily, ['song_id', 'day'],
+                   [{"song_id": song_id, "day": day, "count": count}
+                    for (song_id, day), count in daily.items()])
+
+
+def _increment(model, key_columns, values):
+    if not values:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+
+    if insert is not None:
+        stmt = insert(model).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={"count": model.count + stmt.excluded.count},
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback for databases without ON CONFLICT
+    for value in values:
+        keys = [getattr(model, column) == value[column] for column in key_columns]
+        result = db.session.execute(
+            update(model).where(*keys).values(count=model.count + value["count"])
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            db.session.add(model(**value))
+    db.session.flush()
+
+
+def play_count(song_id):
+    return db.session.scalar(
+        select(SongPlayCount.count).where(SongPlayCount.song_id == song_id)
+    ) or 0
@@ -0,0 +1,138 @@
+"""Buffered ingestion of play events.
+
+Recording a play used to cost one INSERT and one COMMIT per listen. Plays
+are now appended to an in-process buffer and written with a single bulk
+INSERT (plus the matching counter updates) by a background thread, either every PLAY_BUFFER_FLUSH_INTERVAL
+seconds or as soon as PLAY_BUFFER_MAX_SIZE events are waiting. Plays still
+in the buffer are lost if the process is killed, so the flush interval
+bounds how many listens a crash can drop.
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from server.models import db, PlayHistory, Song, User
+from server.play_counters import increment_play_counts
+
+
+class PlayBuffer:
+    def __init__(self, app, max_size, flush_interval, max_backlog):
+        self.app = app
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, user_id, song_id, played_at=None):
+        self.add_many([(user_id, song_id, played_at)])
+
+    def add_many(self, events):
+        """Queue ``(user_id, song_id, played_at)`` tuples for the next flush"""
+        now = datetime.utcnow()
+        rows = [{"user_id": user_id, "song_id": song_id, "played_at": played_at or now}
+                for user_id, song_id, played_at in events]
+
+        if self.max_size <= 1:
+            self._write(rows)
+            return
+
+        self._ensure_thread()
+        with self._lock:
+            self._events.extend(rows)
+            full = len(self._events) >= self.max_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered event to the database; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._events = self._events, []
+            if not rows:
+                return 0
+            try:
+                with self.app.app_context():
+                    self._write(rows)
+            except Exception as e:
+                # Keep the events for the next attempt, but never let a
+                # database outage grow the buffer without bound.
+                with self._lock:
+                    self._events[:0] = rows
+                    dropped = len(self._events) - self.max_backlog
+                    if dropped > 0:
+                        del self._events[:dropped]
+                print(f"Play buffer flush failed, {len(rows)} events kept for retry: {e}")
+                return 0
+            return len(rows)
+
+    def _write(self, rows):
+        try:
+            self._insert(rows)
+        except IntegrityError:
+            # A single unknown song or user must not sink the whole batch
+            db.session.rollback()
+            rows = self._valid_rows(rows)
+            if rows:
+                self._insert(rows)
+
+    @staticmethod
+    def _insert(rows):
+        db.session.execute(insert(PlayHistory), rows)
+        increment_play_counts(rows)
+        db.session.commit()
+
+    @staticmethod
+    def _valid_rows(rows):
+        song_ids = {row["song_id"] for row in rows}
+        user_ids = {row["user_id"] for row in rows}
+        known_songs = set(db.session.scalars(select(Song.id).where(Song.id.in_(song_ids))))
+        known_users = set(db.session.scalars(select(User.id).where(User.id.in_(user_ids))))
+        return [row for row in rows
+                if row["song_id"] in known_songs and row["user_id"] in known_users]
+
+    def _ensure_thread(self):
+        # The thread is started lazily and restarted after a fork, so
+        # gunicorn workers each get their own flusher.
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            if self._pid is not None and self._pid != pid:
+                self._events = []  # inherited from the parent, which flushes them itself
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='play-buffer-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def init_play_buffer(app):
+    buffer = PlayBuffer(
+        app,
+        max_size=app.config['PLAY_BUFFER_MAX_SIZE'],
+        flush_interval=app.config['PLAY_BUFFER_FLUSH_INTERVAL'],
+        max_backlog=app.config['PLAY_BUFFER_MAX_BACKLOG'],
+    )
+    app.extensions['play_buffer'] = buffer
+    atexit.register(buffer.flush)
+    return buffer
+
+
+def get_play_buffer():
+    return current_app.extensions['play_buffer']
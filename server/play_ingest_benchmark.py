@@ -0,0 +1,98 @@
+"""Load test for recording plays: per-play commits against the play buffer.
+
+    python -m server.play_ingest_benchmark [--plays 3000] [--threads 1 8]
+
+Sends POST /api/songs/<id>/play through the Flask test client, from
+``--threads`` threads at once, against a fresh SQLite database (or
+TEST_DATABASE_URL). Two modes:
+
+``commit``    PLAY_BUFFER_MAX_SIZE=1, one INSERT and COMMIT per play, as
+              record_play used to do (and as TestingConfig still does)
+``buffered``  the PlayBuffer with its configured size; the final flush is
+              included in the time
+
+Reports plays per second and request latency, and checks that every play
+reached play_history.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+MODES = ('commit', 'buffered')
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(app, mode, plays, threads, buffer_size):
+    from server.models import db, PlayHistory, Song, User
+    from server.play_ingest import get_play_buffer
+
+    with app.app_context():
+        buffer = get_play_buffer()
+        buffer.max_size = 1 if mode == 'commit' else buffer_size
+        user_id = db.session.scalar(db.select(User.id).order_by(User.id))
+        song_ids = list(db.session.scalars(db.select(Song.id)))
+        before = db.session.query(PlayHistory).count()
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        timings = []
+        for i in range(count):
+            started = time.perf_counter()
+            response = client.post(f'/api/songs/{song_ids[i % len(song_ids)]}/play')
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        with lock:
+            latencies.extend(timings)
+
+    per_thread = [plays // threads + (1 if i < plays % threads else 0) for i in range(threads)]
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(count,)) for count in per_thread]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    buffer.flush()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        written = db.session.query(PlayHistory).count() - before
+    return elapsed, latencies, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--plays', type=int, default=3000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--buffer-size', type=int, default=500,
+                        help='PLAY_BUFFER_MAX_SIZE for the buffered mode.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(directory, 'plays.db')}")
+        from server.app import create_app
+
+        app = create_app('testing')
+        print(f"{args.plays} plays, {app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+        for threads in args.threads:
+            for mode in MODES:
+                elapsed, latencies, written = run(app, mode, args.plays, threads, args.buffer_size)
+                print(f"  {threads:2} threads  {mode:8}  {args.plays / elapsed:7.0f} plays/s  "
+                      f"p50 {statistics.median(latencies) * 1000:5.1f} ms  "
+                      f"p99 {_percentile(latencies, 0.99) * 1000:5.1f} ms  "
+                      f"written {written}/{args.plays}")
+
+
+if __name__ == '__main__':
+    main()
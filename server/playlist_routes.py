@@ -1,28 +1,116 @@
 
 from flask import Blueprint, request, jsonify
-from server.models import db, Playlist, Song
+from sqlalchemy.orm import selectinload
+from server.models import db, Playlist, Song, SongPlayCount, AudioAnalysis
+from server.listing import Derived, keyset_listing
+from server.catalog_cache import catalog_cached
+from server import blob_store
+from server.jobs import enqueue_job
+from server.audio_analysis import analysis_key
 
 playlist_bp = Blueprint('playlist', __name__)
 
+PLAYLIST_FIELDS = {
+    "id": Playlist.id,
+    "title": Playlist.title,
+    "description": Playlist.description
+}
+
+def song_audio_url(song_id, audio_file):
+    """Versioned URL for content-addressed audio, served as immutable"""
+    content_hash = blob_store.blob_hash(audio_file)
+    return f"/api/songs/{song_id}/audio" + (f"?v={content_hash}" if content_hash else "")
+
+SONG_FIELDS = {
+    "id": Song.id,
+    "title": Song.title,
+    "artist": Song.artist,
+    "playlistId": Song.playlist_id,
+    "audioFile": Song.audio_file,
+    "audioUrl": Derived(song_audio_url, Song.id, Song.audio_file)
+}
+
 @playlist_bp.route('/api/playlists', methods=['GET'])
+@catalog_cached
 def get_playlists():
-    playlists = Playlist.query.all()
-    return jsonify([{
-        "id": p.id,
-        "title": p.title,
-        "description": p.description
-    } for p in playlists])
+    # Supports ?limit=&cursor= keyset paging and ?fields= projection
+    return keyset_listing(PLAYLIST_FIELDS, Playlist.id)
 
-@playlist_bp.route('/api/playlists/<int:playlist_id>/songs', methods=['GET'])
-def get_playlist_songs(playlist_id):
-    songs = Song.query.filter_by(playlist_id=playlist_id).all()
-    return jsonify([{
+def song_to_dict(s):
+    return {
         "id": s.id,
         "title": s.title,
         "artist": s.artist,
         "playlistId": s.playlist_id,
-        "audioFile": s.audio_file
-    } for s in songs])
+        "audioFile": s.audio_file,
+        "audioUrl": song_audio_url(s.id, s.audio_file)
+    }
+
+@playlist_bp.route('/api/playlists/<int:playlist_id>/songs', methods=['GET'])
+@catalog_cached
+def get_playlist_songs(playlist_id):
+    # Supports ?limit=&cursor= keyset paging and ?fields= projection
+    return keyset_listing(SONG_FIELDS, Song.id, Song.playlist_id == playlist_id)
+
+@playlist_bp.route('/api/library', methods=['GET'])
+def get_library():
+    """Every playlist with its songs and play counts in one response.
+
+    ``include`` picks the nested data (default ``songs,plays``; add
+    ``durations`` for each song's durationMs). The whole document takes at
+    most four queries regardless of catalog size.
+    """
+    include = set(request.args.get('include', 'songs,plays').split(','))
+
+    query = Playlist.query.order_by(Playlist.id)
+    if 'songs' in include:
+        query = query.options(selectinload(Playlist.songs))
+    playlists = query.all()
+
+    play_counts = {}
+    if 'songs' in include and 'plays' in include:
+        play_counts = dict(db.session.execute(
+            db.select(SongPlayCount.song_id, SongPlayCount.count)
+        ).all())
+
+    durations = {}
+    if 'songs' in include and 'durations' in include:
+        keys = {analysis_key('songs', s.audio_file) for p in playlists for s in p.songs}
+        if keys:
+            durations = dict(db.session.execute(
+                db.select(AudioAnalysis.audio_file, AudioAnalysis.duration_ms)
+                .where(AudioAnalysis.audio_file.in_(keys))
+            ).all())
+
+    library = []
+    for p in playlists:
+        item = {
+            "id": p.id,
+            "title": p.title,
+            "description": p.description
+        }
+        if 'songs' in include:
+            item["songs"] = []
+            for s in sorted(p.songs, key=lambda s: s.id):
+                song = song_to_dict(s)
+                if 'plays' in include:
+                    song["plays"] = play_counts.get(s.id, 0)
+                if 'durations' in include:
+                    song["durationMs"] = durations.get(analysis_key('songs', s.audio_file))
+                item["songs"].append(song)
+        library.append(item)
+
+    return jsonify(library)
+
+@playlist_bp.route('/api/playlists/<int:playlist_id>/plays', methods=['GET'])
+def get_playlist_play_counts(playlist_id):
+    # One query for the whole playlist instead of one /plays call per song
+    rows = db.session.execute(
+        db.select(Song.id, db.func.coalesce(SongPlayCount.count, 0))
+        .outerjoin(SongPlayCount, SongPlayCount.song_id == Song.id)
+        .where(Song.playlist_id == playlist_id)
+    ).all()
+    return jsonify({str(song_id): count for song_id, count in rows})
 
 @playlist_bp.route('/api/playlists/<int:playlist_id>/songs', methods=['POST'])
 def upload_song(playlist_id):
@@ -43,33 +131,19 @@ def upload_song(playlist_id):
     if not title or not artist:
         return jsonify({"error": "Title and artist are required"}), 400
     
-    # Generate a unique filename to prevent conflicts
-    import uuid
-    filename = f"{uuid.uuid4()}_{audio_file.filename}"
-    
-    # Ensure storage directory exists
-    import os
-    storage_dir = os.path.join(os.path.dirname(__file__), 'storage', 'audio')
-    os.makedirs(storage_dir, exist_ok=True)
-    
-    # Save file to disk
-    file_path = os.path.join(storage_dir, filename)
-    audio_file.save(file_path)
-    
-    # Save to database (without audio_data)
+    # Store by content, so uploading the same audio twice keeps one copy
+    audio_key = blob_store.ingest_stream(audio_file.stream, blob_store.file_extension(audio_file.filename))
+
     song = Song(
         title=title,
         artist=artist,
         playlist_id=playlist_id,
-        audio_file=filename
+        audio_file=audio_key
     )
+    blob_store.add_ref(audio_key)
     db.session.add(song)
     db.session.commit()
+    enqueue_job('transcode', song.id)
+    enqueue_job('analyze_song', song.id)
     
-    return jsonify({
-        "id": song.id,
-        "title": song.title,
-        "artist": song.artist,
-        "playlistId": song.playlist_id,
-        "audioFile": song.audio_file
-    }), 201
+    return jsonify(song_to_dict(song)), 201
@@ -0,0 +1,141 @@
+"""Rebuild many lessons at once, e.g. after a storage move or codec change.
+
+    flask rebuild-lessons [--lesson ID ...] [--title TEXT] [--force]
+                          [--processes N] [--resume] [--dry-run]
+
+Lessons whose lines and build settings have not changed since their last
+build (see lesson_fingerprint) are skipped unless ``--force`` is given.
+The rest are built in a process pool, one lesson per process at a time.
+Finished lesson ids are written to a state file as they complete, so a
+run that was interrupted can be continued with ``--resume``.
+"""
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+
+import click
+from flask import current_app
+
+from server.models import db, Lesson
+from server.lesson_builder import build_lesson, is_up_to_date
+from server.mp3_frames import scan_mp3
+from server import blob_store, jobs, run_state
+
+
+def select_lessons(lesson_ids=(), title=None, force=False, exclude=()):
+    """``(to_build, skipped)`` lesson ids for the given filters"""
+    query = Lesson.query.order_by(Lesson.id)
+    if lesson_ids:
+        query = query.filter(Lesson.id.in_(lesson_ids))
+    if title:
+        query = query.filter(Lesson.title.ilike(f'%{title}%'))
+
+    to_build, skipped = [], []
+    for lesson in query:
+        if lesson.id in exclude:
+            continue
+        if not lesson.lines:
+            skipped.append(lesson.id)
+        elif not force and is_up_to_date(lesson):
+            skipped.append(lesson.id)
+        else:
+            to_build.append(lesson.id)
+    return to_build, skipped
+
+
+def _rebuild_in_process(lesson_id):
+    """Build one lesson in a pool process; returns ``(seconds, audio_seconds, bytes)``"""
+    with jobs.process_app().app_context():
+        try:
+            started = time.perf_counter()
+            song = build_lesson(lesson_id)
+            elapsed = time.perf_counter() - started
+
+            path = blob_store.resolve_audio_path('songs', song.audio_file)
+            index = scan_mp3(path)
+            audio_seconds = len(index.offsets) * index.samples_per_frame / index.sample_rate
+            return elapsed, audio_seconds, os.path.getsize(path)
+        finally:
+            db.session.remove()
+
+
+def rebuild_lessons(app, lesson_ids, processes, state_path, state):
+    """Build ``lesson_ids`` across a process pool, recording progress in ``state``"""
+    built = failed = 0
+    audio_seconds = output_bytes = 0
+    started = time.perf_counter()
+
+    with jobs.start_pool(processes, app.config.get('CONFIG_NAME')) as pool:
+        futures = {pool.submit(_rebuild_in_process, lesson_id): lesson_id for lesson_id in lesson_ids}
+        for future in as_completed(futures):
+            lesson_id = futures[future]
+            try:
+                _, seconds, size = future.result()
+            except Exception as e:
+                failed += 1
+                state['failed'][str(lesson_id)] = str(e)
+                print(f"Lesson {lesson_id} failed: {e}")
+            else:
+                built += 1
+                audio_seconds += seconds
+                output_bytes += size
+                state['done'].append(lesson_id)
+                state['failed'].pop(str(lesson_id), None)
+            run_state.save_state(state_path, state)
+            print(f"[{built + failed}/{len(lesson_ids)}] lesson {lesson_id}")
+
+    elapsed = time.perf_counter() - started
+    return built, failed, elapsed, audio_seconds, output_bytes
+
+
+@click.command('rebuild-lessons')
+@click.option('--lesson', 'lesson_ids', type=int, multiple=True, help='Only this lesson id (repeatable).')
+@click.option('--title', default=None, help='Only lessons whose title contains this text.')
+@click.option('--force', is_flag=True, help='Rebuild even if nothing changed since the last build.')
+@click.option('--processes', type=int, default=None, help='Worker processes (defaults to the CPU count).')
+@click.option('--resume', is_flag=True, help='Skip lessons the previous, interrupted run finished.')
+@click.option('--dry-run', is_flag=True, help='Only list the lessons that would be rebuilt.')
+def rebuild_lessons_command(lesson_ids, title, force, processes, resume, dry_run):
+    """Rebuild every lesson, or a filtered set, in parallel."""
+    app = current_app._get_current_object()
+    state_path = run_state.state_path('rebuild-lessons')
+
+    state = run_state.load_state(state_path) if resume else None
+    if resume and state is None:
+        print("No previous run to resume, starting a new one")
+    if state is None:
+        state = {"startedAt": datetime.utcnow().isoformat(), "done": [], "failed": {}}
+
+    to_build, skipped = select_lessons(lesson_ids, title, force, exclude=set(state['done']))
+    print(f"{len(to_build)} lessons to rebuild, {len(skipped)} unchanged, "
+          f"{len(state['done'])} already done in this run")
+    if dry_run:
+        for lesson_id in to_build:
+            print(f"  would rebuild lesson {lesson_id}")
+        return
+    if not to_build:
+        run_state.clear_state(state_path)
+        return
+
+    processes = min(processes or os.cpu_count() or 1, len(to_build))
+    db.session.remove()  # do not hold a connection while the pool works
+    built, failed, elapsed, audio_seconds, output_bytes = rebuild_lessons(
+        app, to_build, processes, state_path, state)
+
+    print(f"Rebuilt {built} lessons ({failed} failed, {len(skipped)} skipped) "
+          f"in {elapsed:.1f}s with {processes} processes")
+    if elapsed > 0:
+        print(f"Throughput: {built / elapsed:.2f} lessons/s, "
+              f"{audio_seconds / elapsed:.1f}x realtime "
+              f"({audio_seconds / 60:.1f} min of audio, {output_bytes / 1024 / 1024:.1f} MiB written)")
+    if not failed:
+        run_state.clear_state(state_path)  # the run is complete; nothing left to resume
+    else:
+        print(f"Progress saved to {state_path}; rerun with --resume to retry the failures")
+
+
+if __name__ == '__main__':
+    from server.app import create_app
+    with create_app().app_context():
+        rebuild_lessons_command()
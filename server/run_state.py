@@ -0,0 +1,40 @@
+"""Progress files that let long CLI runs resume after an interruption.
+
+migrate-storage and rebuild-lessons save a small JSON document under
+``AUDIO_STORAGE_ROOT/cache`` after every unit of work, written to a
+temporary file and renamed so a crash never leaves half a document.
+"""
+import json
+import os
+
+from flask import current_app
+
+
+def state_path(name):
+    """Where the command called ``name`` keeps its progress"""
+    return os.path.join(current_app.config['AUDIO_STORAGE_ROOT'], 'cache', f'{name}.json')
+
+
+def load_state(path):
+    """The saved progress, or None if there is none (or it is unreadable)"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def clear_state(path):
+    """Forget the progress of a finished run; fine if none was ever saved"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
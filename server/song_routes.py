@@ -1,32 +1,248 @@
 
-from flask import Blueprint, request, jsonify, send_file, current_app
-import os
-from server.models import db, Song, PlayHistory
+from flask import Blueprint, request, jsonify, current_app, redirect, url_for, abort
+import mimetypes
+from datetime import datetime, timedelta, timezone
+from server.models import db, Song, SongPlayDaily, Lesson, Line, LineOffset, AudioAnalysis
+from server.play_ingest import get_play_buffer
+from server.play_counters import play_count
+from server.audio_streaming import send_audio, IMMUTABLE_MAX_AGE
+from server.blob_store import resolve_audio_path, blob_hash
+from server.transcode import current_rendition
+from server.hls import has_hls, hls_file, MANIFEST_NAME
+from server.catalog_cache import catalog_cached
+from server.audio_analysis import analysis_key
+from server.auth_tokens import current_user_id
+
+# How far ahead of the server a client clock may be before its playedAt is refused
+MAX_PLAY_CLOCK_SKEW = timedelta(days=1)
 
 song_bp = Blueprint('song', __name__)
 
 @song_bp.route('/api/songs/<int:song_id>/audio', methods=['GET'])
 def get_song_audio(song_id):
     song = Song.query.get_or_404(song_id)
-    file_path = os.path.join(current_app.config['AUDIO_STORAGE_ROOT'], 'songs', song.audio_file)
-    return send_file(
+    content_hash = blob_hash(song.audio_file)
+    quality, from_accept = _requested_quality()
+
+    rendition = current_rendition(song, quality) if quality else None
+    if rendition:
+        file_path = resolve_audio_path('songs', rendition.audio_file)
+        mimetype = 'audio/mpeg'
+        etag = blob_hash(rendition.audio_file)
+    else:
+        file_path = resolve_audio_path('songs', song.audio_file)
+        mimetype = mimetypes.guess_type(file_path)[0] or 'audio/mpeg'
+        etag = content_hash
+
+    response = send_audio(
         file_path,
-        mimetype='audio/mpeg'
+        mimetype=mimetype,
+        max_age=current_app.config['AUDIO_CACHE_MAX_AGE'],
+        etag=etag,
+        # ?v=<hash> URLs (see song_to_dict) name one exact source forever. A
+        # missing rendition is not cached for good, so it is picked up later.
+        immutable=(content_hash is not None and request.args.get('v') == content_hash
+                   and (rendition is not None or not quality))
     )
+    if from_accept:
+        response.vary.add('Accept')
+    return response
+
+@song_bp.route('/api/lines/<int:line_id>/audio', methods=['GET'])
+def get_line_audio(line_id):
+    line = Line.query.get_or_404(line_id)
+    if not line.audio_file:
+        abort(404)
+    content_hash = blob_hash(line.audio_file)
+    file_path = resolve_audio_path('lines', line.audio_file)
+    return send_audio(
+        file_path,
+        mimetype=mimetypes.guess_type(file_path)[0] or 'audio/mpeg',
+        max_age=current_app.config['AUDIO_CACHE_MAX_AGE'],
+        etag=content_hash,
+        immutable=content_hash is not None and request.args.get('v') == content_hash
+    )
+
+@song_bp.route('/api/songs/<int:song_id>/hls.m3u8', methods=['GET'])
+def get_song_hls(song_id):
+    song = Song.query.get_or_404(song_id)
+    content_hash = blob_hash(song.audio_file)
+    if not has_hls(content_hash):
+        return jsonify({"error": "No segmented audio for this song"}), 404
+
+    # Points at the current build; the playlist and segments it names are immutable
+    response = redirect(url_for('song.get_hls_file', sha256=content_hash, name=MANIFEST_NAME))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@song_bp.route('/api/songs/<int:song_id>/lines', methods=['GET'])
+@catalog_cached
+def get_song_lines(song_id):
+    """Start/end of each line in a built lesson's audio.
+
+    Byte offsets point at MP3 frame boundaries in the original audio (not
+    the renditions), so ``Range: bytes=<startByte>-<endByte - 1>`` fetches
+    exactly one line.
+    """
+    song = Song.query.get_or_404(song_id)
+    lesson = Lesson.query.filter_by(song_id=song.id).first()
+    if lesson is None:
+        return jsonify({"error": "Song is not a built lesson"}), 404
+
+    rows = db.session.execute(
+        db.select(LineOffset, Line.order, Line.text)
+        .join(Line, Line.id == LineOffset.line_id)
+        .where(LineOffset.lesson_id == lesson.id, LineOffset.audio_file == song.audio_file)
+        .order_by(LineOffset.start_ms)
+    ).all()
+    return jsonify({
+        "songId": song.id,
+        "lessonId": lesson.id,
+        "lines": [{
+            "lineId": offset.line_id,
+            "order": order,
+            "text": text,
+            "startMs": offset.start_ms,
+            "endMs": offset.end_ms,
+            "startByte": offset.start_byte,
+            "endByte": offset.end_byte
+        } for offset, order, text in rows]
+    })
+
+@song_bp.route('/api/hls/<sha256>/<name>', methods=['GET'])
+def get_hls_file(sha256, name):
+    found = hls_file(sha256, name)
+    if found is None:
+        abort(404)
+    path, mimetype = found
+    return send_audio(path, mimetype=mimetype, etag=f'{sha256}-{name}', immutable=True)
+
+@song_bp.route('/api/songs/<int:song_id>/peaks', methods=['GET'])
+def get_song_peaks(song_id):
+    song = Song.query.get_or_404(song_id)
+    return _peaks_response('songs', song.audio_file)
+
+@song_bp.route('/api/lines/<int:line_id>/peaks', methods=['GET'])
+def get_line_peaks(line_id):
+    line = Line.query.get_or_404(line_id)
+    return _peaks_response('lines', line.audio_file)
+
+def _peaks_response(kind, name):
+    """Waveform peaks as raw int8 (min, max) pairs, or JSON with ?format=json.
+
+    Peaks never change for a given audio file, so the response is
+    immutable when requested with ?v=<content hash>, like the audio itself.
+    """
+    analysis = db.session.get(AudioAnalysis, analysis_key(kind, name)) if name else None
+    if analysis is None:
+        return jsonify({"error": "Audio has not been analysed yet"}), 404
+
+    if request.args.get('format') == 'json':
+        response = jsonify({
+            "durationMs": analysis.duration_ms,
+            "peaksPerSecond": analysis.peaks_per_second,
+            "loudnessDb": analysis.loudness_db,
+            "peaks": list(memoryview(analysis.peaks).cast('b'))
+        })
+    else:
+        response = current_app.response_class(analysis.peaks, mimetype='application/octet-stream')
+        response.headers['X-Duration-Ms'] = str(analysis.duration_ms)
+        response.headers['X-Peaks-Per-Second'] = str(analysis.peaks_per_second)
+
+    content_hash = blob_hash(name)
+    response.set_etag(f'peaks-{content_hash or analysis.audio_file}')
+    if content_hash is not None and request.args.get('v') == content_hash:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def _requested_quality():
+    """Rendition asked for with ?quality=low or ``Accept: audio/mpeg; quality=low``.
+
+    Returns ``(quality, from_accept)``; unknown qualities are ignored.
+    """
+    renditions = current_app.config['AUDIO_RENDITIONS']
+    quality = request.args.get('quality')
+    if quality:
+        return (quality if quality in renditions else None), False
+
+    for media_range in request.headers.get('Accept', '').split(','):
+        for param in media_range.split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'quality':
+                value = value.strip().strip('"').lower()
+                return (value if value in renditions else None), True
+    return None, True
 
 @song_bp.route('/api/songs/<int:song_id>/play', methods=['POST'])
 def record_play(song_id):
-    from flask import session
-    user_id = session.get('user_id')
+    user_id = current_user_id()
     if not user_id:
         return jsonify({"error": "User not authenticated"}), 401
-        
-    play = PlayHistory(user_id=user_id, song_id=song_id)
-    db.session.add(play)
-    db.session.commit()
+
+    get_play_buffer().add(user_id, song_id)
     return '', 200
 
+@song_bp.route('/api/plays', methods=['POST'])
+def record_plays():
+    """Record several plays at once: {"plays": [{"songId": 1, "playedAt": "<ISO 8601>"}, ...]}
+
+    Plays older than PLAY_MAX_BACKDATE_SECONDS are dropped (and counted in
+    the response) so clients cannot fill in past days of /plays/daily; a
+    small clock skew into the future is clamped to now, anything further
+    ahead is rejected.
+    """
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify({"error": "User not authenticated"}), 401
+
+    data = request.json
+    plays = data.get('plays') if isinstance(data, dict) else None
+    if not isinstance(plays, list) or not plays:
+        return jsonify({"error": "plays must be a non-empty list"}), 400
+    if len(plays) > current_app.config['PLAY_BATCH_MAX_SIZE']:
+        return jsonify({"error": f"At most {current_app.config['PLAY_BATCH_MAX_SIZE']} plays per request"}), 400
+
+    events = []
+    dropped = 0
+    now = datetime.utcnow()
+    oldest = now - timedelta(seconds=current_app.config['PLAY_MAX_BACKDATE_SECONDS'])
+    for play in plays:
+        song_id = play.get('songId') if isinstance(play, dict) else None
+        if not isinstance(song_id, int):
+            return jsonify({"error": "Each play needs an integer songId"}), 400
+
+        played_at = None
+        if play.get('playedAt'):
+            try:
+                played_at = datetime.fromisoformat(play['playedAt'])
+            except (TypeError, ValueError):
+                return jsonify({"error": "playedAt must be an ISO 8601 timestamp"}), 400
+            if played_at.tzinfo is not None:
+                played_at = played_at.astimezone(timezone.utc).replace(tzinfo=None)
+            if played_at > now + MAX_PLAY_CLOCK_SKEW:
+                return jsonify({"error": "playedAt is in the future"}), 400
+            if played_at < oldest:
+                dropped += 1
+                continue
+            played_at = min(played_at, now)  # clients cannot record plays in the future
+
+        events.append((user_id, song_id, played_at))
+
+    get_play_buffer().add_many(events)
+    return jsonify({"accepted": len(events), "dropped": dropped}), 202
+
 @song_bp.route('/api/songs/<int:song_id>/plays', methods=['GET'])
 def get_play_count(song_id):
-    count = PlayHistory.query.filter_by(song_id=song_id).count()
-    return jsonify(count)
+    return jsonify(play_count(song_id))
+
+@song_bp.route('/api/songs/<int:song_id>/plays/daily', methods=['GET'])
+def get_daily_play_counts(song_id):
+    days = min(request.args.get('days', 30, type=int), 366)
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = (SongPlayDaily.query
+            .filter(SongPlayDaily.song_id == song_id, SongPlayDaily.day >= since)
+            .order_by(SongPlayDaily.day)
+            .all())
+    return jsonify([{"day": r.day.isoformat(), "count": r.count} for r in rows])
@@ -0,0 +1,74 @@
+"""Measure how long a fresh process takes to load the app from wsgi.py.
+
+    python -m server.startup_benchmark [--runs N] [--imports]
+
+Each run starts a new interpreter, so nothing is cached in memory, and
+reports the time spent in ``import server.wsgi`` (imports plus
+create_app) and the whole process wall time. ``--imports`` also lists
+the slowest top-level imports of one run (``python -X importtime``).
+FLASK_ENV and the usual settings are taken from the environment.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = (
+    "import time; started = time.perf_counter(); import server.wsgi; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure(runs):
+    """``(load seconds, process seconds)`` for each run"""
+    results = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', _PROBE], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        results.append((float(output.strip().splitlines()[-1]), time.perf_counter() - started))
+    return results
+
+
+def slowest_imports(limit=15):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import server.wsgi'],
+                            cwd=ROOT, check=True, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # Nesting: server.wsgi > server.app > what the app imports
+        if depth <= 2 and name.strip() not in ('server.wsgi', 'server.app'):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--imports', action='store_true', help='Also list the slowest imports.')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    load = [r[0] for r in results]
+    total = [r[1] for r in results]
+    print(f"{args.runs} runs, FLASK_ENV={os.getenv('FLASK_ENV', 'default')}")
+    print(f"  import server.wsgi: median {statistics.median(load) * 1000:.0f} ms, "
+          f"min {min(load) * 1000:.0f} ms, max {max(load) * 1000:.0f} ms")
+    print(f"  process wall time:  median {statistics.median(total) * 1000:.0f} ms, "
+          f"min {min(total) * 1000:.0f} ms, max {max(total) * 1000:.0f} ms")
+
+    if args.imports:
+        print("Slowest imports (cumulative):")
+        for microseconds, name in slowest_imports():
+            print(f"  {microseconds / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Where stored audio physically lives.
+
+Everything below AUDIO_STORAGE_ROOT is addressed by a relative key such as
+``blobs/ab/cd/<sha256>.mp3`` or ``hls/<sha256>/index.m3u8``, and goes
+through one of these backends (STORAGE_BACKEND):
+
+``local``  files under AUDIO_STORAGE_ROOT, as before.
+``s3``     an S3-compatible bucket (AWS, MinIO, ...; S3_ENDPOINT_URL points
+           at a local stand-in for testing), wrapped in CachedStorage, a
+           read-through disk cache with LRU eviction. Hot audio is then
+           served and decoded from local disk.
+
+ffmpeg and sendfile need real files, so readers ask for ``local_path(key)``.
+Local storage returns the file itself; the cache downloads it first if
+needed. Either way a missing key yields a path that does not exist, so
+callers keep checking with ``os.path.exists``. Code that only needs to
+know whether a file is there, or whether it changed, uses ``exists`` and
+``version`` instead, which never download anything. New files are written
+to ``temp_dir()`` and handed over with ``put_file``.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timezone
+
+from flask import current_app
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        return os.path.join(self.root, key)
+
+    def temp_dir(self):
+        # Same volume as the files, so put_file is a rename
+        path = os.path.join(self.root, 'blobs', 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def version(self, key):
+        """Changes whenever the file at ``key`` is replaced; None if there is none"""
+        try:
+            stat = os.stat(self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    def put_file(self, path, key):
+        """Move a local file to ``key``"""
+        target = self.local_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.chmod(path, 0o644)
+        os.replace(path, target)
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_files(self, prefix):
+        """``(key, size, mtime)`` for every file whose key starts with ``prefix``"""
+        base = self.local_path(prefix)
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), stat.st_size, stat.st_mtime
+
+
+class S3Storage:
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3, or the 's3' extra)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def version(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        etag = head['ETag'].strip('"')
+        return f"{head['ContentLength']}:{etag}"
+
+    def download(self, key, path):
+        """Fetch ``key`` into ``path``; False if there is no such key"""
+        from botocore.exceptions import ClientError
+        try:
+            self.client.download_file(self.bucket, self._key(key), path)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, path, key):
+        self.client.upload_file(path, self.bucket, self._key(key))
+        os.remove(path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def iter_files(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                modified = item['LastModified'].replace(tzinfo=item['LastModified'].tzinfo or timezone.utc)
+                yield item['Key'][len(self.prefix):], item['Size'], modified.timestamp()
+
+
+class CachedStorage:
+    """Read-through local disk cache in front of a remote backend.
+
+    Files are evicted least recently used first once the cache grows past
+    ``max_bytes``. Use is tracked in the access time, which is set
+    explicitly on every hit so it works on noatime mounts too.
+    """
+
+    def __init__(self, backend, directory, max_bytes):
+        self.backend = backend
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _cache_path(self, key):
+        return os.path.join(self.directory, 'files', key)
+
+    def local_path(self, key):
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.temp_dir())
+        os.close(fd)
+        try:
+            if not self.backend.download(key, tmp_path):
+                return path  # does not exist, like a missing local file
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=path)
+        return path
+
+    def temp_dir(self):
+        path = os.path.join(self.directory, 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self._cache_path(key)) or self.backend.exists(key)
+
+    def version(self, key):
+        # The remote file's, not the cached copy's, which changes on every download
+        return self.backend.version(key)
+
+    def put_file(self, path, key):
+        # Keep a copy: freshly stored audio is usually played soon
+        cached = self._cache_path(key)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        shutil.copyfile(path, cached)
+        self.backend.put_file(path, key)
+        self.evict(keep=cached)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        try:
+            os.remove(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_files(self, prefix):
+        return self.backend.iter_files(prefix)
+
+    def evict(self, keep=None):
+        """Drop least recently used files until the cache fits in ``max_bytes``"""
+        with self._lock:
+            entries = []
+            total = 0
+            for dirpath, _, filenames in os.walk(os.path.join(self.directory, 'files')):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_atime, stat.st_size, path))
+                    total += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def create_storage(config):
+    backend = config['STORAGE_BACKEND']
+    if backend == 'local':
+        return LocalStorage(config['AUDIO_STORAGE_ROOT'])
+    if backend == 's3':
+        remote = S3Storage(config['S3_BUCKET'], prefix=config['S3_PREFIX'],
+                           endpoint_url=config['S3_ENDPOINT_URL'], region=config['S3_REGION'])
+        return CachedStorage(remote, config['STORAGE_CACHE_DIR'], config['STORAGE_CACHE_MAX_BYTES'])
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage():
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = current_app.extensions['storage'] = create_storage(current_app.config)
+    return storage
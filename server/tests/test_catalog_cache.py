@@ -0,0 +1,81 @@
+"""Catalog ETags follow writes made by any process sharing the database.
+
+Two apps on one SQLite file stand in for two gunicorn workers (or a web
+worker and the job worker), each with its own in-process cache.
+"""
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import func, select
+
+from server.catalog_cache import catalog_cached, init_catalog_cache
+from server.models import db, Lesson, LineOffset, Playlist
+
+
+@catalog_cached
+def playlist_count():
+    return jsonify(count=db.session.scalar(select(func.count()).select_from(Playlist)))
+
+
+def _make_app(uri):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=uri, REPLICA_BLUEPRINTS=[],
+                      CATALOG_CACHE_TTL=3600, CATALOG_CACHE_MAX_ENTRIES=16)
+    db.init_app(app)
+    init_catalog_cache(app)
+    app.add_url_rule('/playlists', view_func=playlist_count)
+    return app
+
+
+@pytest.fixture
+def apps(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'catalog.db'}"
+    first, second = _make_app(uri), _make_app(uri)
+    with first.app_context():
+        db.create_all()
+    return first, second
+
+
+def _write(app, change):
+    with app.app_context():
+        change()
+        db.session.commit()
+
+
+def test_workers_share_etags(apps):
+    first, second = apps
+    etag = first.test_client().get('/playlists').headers['ETag']
+    assert second.test_client().get('/playlists').headers['ETag'] == etag
+    assert second.test_client().get('/playlists', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_write_in_another_process_changes_the_etag(apps):
+    first, second = apps
+    client = first.test_client()
+    etag = client.get('/playlists').headers['ETag']
+
+    _write(second, lambda: db.session.add(Playlist(title='new', description='')))
+
+    response = client.get('/playlists', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json == {'count': 1}  # not the cached body
+
+
+def test_bulk_delete_changes_the_etag(apps):
+    first, second = apps
+    _write(second, lambda: db.session.add(Lesson(title='lesson')))
+    etag = first.test_client().get('/playlists').headers['ETag']
+
+    _write(second, lambda: LineOffset.query.filter_by(lesson_id=1).delete(synchronize_session=False))
+
+    assert first.test_client().get('/playlists', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_rolled_back_write_keeps_the_etag(apps):
+    first, second = apps
+    etag = first.test_client().get('/playlists').headers['ETag']
+    with second.app_context():
+        db.session.add(Playlist(title='discarded', description=''))
+        db.session.flush()
+        db.session.rollback()
+
+    assert first.test_client().get('/playlists', headers={'If-None-Match': etag}).status_code == 304
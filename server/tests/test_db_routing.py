@@ -0,0 +1,95 @@
+"""Reads that must see the latest writes go to the primary, not the replica.
+
+Two SQLite files stand in for the primary and its replica. The replica
+never receives the primary's writes, so a read that reaches it sees an
+empty table, as it would while lagging behind.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Blueprint, Flask, jsonify, request
+from sqlalchemy import func, select
+
+from server.auth_tokens import bearer_claims, init_auth_tokens, issue_token, verify_token
+from server.db_routing import REPLICA_BIND, init_replica
+from server.models import db, Playlist, RevokedToken
+
+song_bp = Blueprint('song', __name__)
+
+
+@song_bp.route('/playlists', methods=['GET', 'POST'])
+def playlists():
+    authenticated = bearer_claims() is not None
+    if request.method == 'POST':
+        db.session.add(Playlist(title='new'))
+        db.session.commit()
+    return jsonify(count=db.session.scalar(select(func.count()).select_from(Playlist)),
+                   authenticated=authenticated)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS={REPLICA_BIND: f"sqlite:///{tmp_path / 'replica.db'}"},
+        REPLICA_BLUEPRINTS=['song'],
+        REPLICA_PIN_SECONDS=60,
+        REPLICA_RETRY_SECONDS=30,
+        AUTH_TOKENS_ENABLED=True,
+        AUTH_TOKEN_MAX_AGE=3600,
+        AUTH_TOKEN_CACHE_MAX_ENTRIES=100,
+        AUTH_REVOCATION_REFRESH=0,
+    )
+    db.init_app(app)
+    init_replica(app, db)
+    init_auth_tokens(app)
+    app.register_blueprint(song_bp)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines[REPLICA_BIND])
+        db.session.add(Playlist(title='on the primary only'))
+        db.session.commit()
+    yield app
+    # init_app registered the bind on the shared db; other tests' create_all would use it
+    db.metadatas.pop(REPLICA_BIND, None)
+
+
+def _token(app, user_id=1):
+    with app.test_request_context():
+        return issue_token(user_id, f'user{user_id}', False)[0]
+
+
+def test_reads_go_to_the_replica(app):
+    response = app.test_client().get('/playlists')
+    assert response.json['count'] == 0
+
+
+def test_revocations_are_read_from_the_primary(app):
+    token = _token(app)
+    with app.test_request_context():
+        jti = verify_token(token)['jti']
+        db.session.add(RevokedToken(jti=jti, user_id=1, expires_at=datetime.utcnow() + timedelta(hours=1)))
+        db.session.commit()
+
+    response = app.test_client().get('/playlists', headers={'Authorization': f'Bearer {token}'})
+    assert response.json['authenticated'] is False
+
+
+def test_cookie_session_is_pinned_after_a_write(app):
+    client = app.test_client()
+    client.post('/playlists')
+    assert client.get('/playlists').json['count'] == 2
+
+
+def test_bearer_token_user_is_pinned_after_a_write(app):
+    token = _token(app)
+    headers = {'Authorization': f'Bearer {token}'}
+    app.test_client(use_cookies=False).post('/playlists', headers=headers)
+
+    response = app.test_client(use_cookies=False).get('/playlists', headers=headers)
+    assert response.json == {'count': 2, 'authenticated': True}
+    # Another user is not pinned
+    other = {'Authorization': f'Bearer {_token(app, user_id=2)}'}
+    assert app.test_client(use_cookies=False).get('/playlists', headers=other).json['count'] == 0
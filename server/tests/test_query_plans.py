@@ -0,0 +1,110 @@
+"""The hot queries must use the composite indexes, not scan their tables.
+
+Seeds SQLite with QUERY_PLAN_ROWS play_history rows (and a tenth as many
+songs and lines), runs ANALYZE so the planner sees realistic statistics,
+and checks EXPLAIN QUERY PLAN for each query. Raise the size to check
+the plans against production-like volumes:
+
+    QUERY_PLAN_ROWS=1000000 python -m pytest server/tests/test_query_plans.py
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import func, insert, select, text
+
+from server.models import db, User, Playlist, Song, PlayHistory, Lesson, Line
+
+ROWS = int(os.getenv('QUERY_PLAN_ROWS', '20000'))
+PLAYLISTS = 100
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        _seed()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def _seed():
+    rng = random.Random(7)
+    songs = max(ROWS // 10, PLAYLISTS)
+    users = max(ROWS // 100, 1)
+    db.session.execute(insert(User), [
+        {"id": i, "username": f"user{i}", "password": "x"} for i in range(1, users + 1)])
+    db.session.execute(insert(Playlist), [
+        {"id": i, "title": f"playlist {i}"} for i in range(1, PLAYLISTS + 1)])
+    db.session.execute(insert(Song), [
+        {"id": i, "title": f"song {i}", "artist": "a", "playlist_id": rng.randint(1, PLAYLISTS),
+         "audio_file": f"{i}.mp3"} for i in range(1, songs + 1)])
+    start = datetime(2024, 1, 1)
+    db.session.execute(insert(PlayHistory), [
+        {"user_id": rng.randint(1, users), "song_id": rng.randint(1, songs),
+         "played_at": start + timedelta(minutes=i)} for i in range(ROWS)])
+    db.session.execute(insert(Lesson), [
+        {"id": i, "title": f"lesson {i}", "song_id": i} for i in range(1, songs // 10 + 1)])
+    db.session.execute(insert(Line), [
+        {"text": "line", "audio_file": "", "lesson_id": rng.randint(1, songs // 10),
+         "order": rng.randint(1, 50)} for _ in range(songs)])
+    db.session.commit()
+
+
+def _plan(stmt):
+    sql = stmt.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+    return [row[3] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+def _assert_uses_index(plan, table, index):
+    assert any(index in step for step in plan), plan
+    # "SCAN <table>" alone is a full table scan; "SCAN ... USING INDEX" is not
+    assert f'SCAN {table}' not in plan, plan
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_playlist_songs_page(app):
+    stmt = (select(Song.id, Song.title, Song.artist)
+            .where(Song.playlist_id == 7, Song.id > 100)
+            .order_by(Song.id).limit(50))
+    _assert_uses_index(_plan(stmt), 'song', 'ix_song_playlist_id_id')
+
+
+def test_song_play_history(app):
+    stmt = (select(PlayHistory)
+            .where(PlayHistory.song_id == 42)
+            .order_by(PlayHistory.played_at.desc()).limit(100))
+    _assert_uses_index(_plan(stmt), 'play_history', 'ix_play_history_song_id_played_at')
+
+
+def test_user_play_history(app):
+    stmt = (select(PlayHistory)
+            .where(PlayHistory.user_id == 3)
+            .order_by(PlayHistory.played_at.desc()).limit(100))
+    _assert_uses_index(_plan(stmt), 'play_history', 'ix_play_history_user_id_played_at')
+
+
+def test_play_counts_per_song(app):
+    stmt = (select(PlayHistory.song_id, func.count())
+            .where(PlayHistory.song_id.in_([1, 2, 3]))
+            .group_by(PlayHistory.song_id))
+    plan = _plan(stmt)
+    _assert_uses_index(plan, 'play_history', 'ix_play_history_song_id_played_at')
+    assert any('COVERING INDEX' in step for step in plan), plan
+
+
+def test_lesson_lines_in_order(app):
+    stmt = select(Line).where(Line.lesson_id == 5).order_by(Line.order)
+    _assert_uses_index(_plan(stmt), 'line', 'ix_line_lesson_id_order')
+
+
+def test_lesson_for_song(app):
+    stmt = select(Lesson).where(Lesson.song_id == 9)
+    _assert_uses_index(_plan(stmt), 'lesson', 'ix_lesson_song_id')
@@ -0,0 +1,154 @@
+"""S3Storage and its disk cache against moto's in-memory S3 stand-in."""
+import os
+import time
+
+import pytest
+
+pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+from server.storage_backends import CachedStorage, LocalStorage, S3Storage
+
+BUCKET = 'audio-test'
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    for name, value in (('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        storage = S3Storage(BUCKET, prefix='audio', region='us-east-1')
+        storage.client.create_bucket(Bucket=BUCKET)
+        yield storage
+
+
+@pytest.fixture
+def cached(remote, tmp_path):
+    return CachedStorage(remote, str(tmp_path / 'cache'), max_bytes=1024 * 1024)
+
+
+def _put_remote(remote, key, body):
+    remote.client.put_object(Bucket=BUCKET, Key=f'audio/{key}', Body=body)
+
+
+def _scratch_file(storage, body):
+    path = os.path.join(storage.temp_dir(), f'new-{time.monotonic_ns()}')
+    with open(path, 'wb') as f:
+        f.write(body)
+    return path
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_miss_reads_through_and_hit_stays_local(remote, cached):
+    _put_remote(remote, 'blobs/ab/cd/one.mp3', b'first')
+
+    path = cached.local_path('blobs/ab/cd/one.mp3')
+    assert _read(path) == b'first'
+
+    remote.delete('blobs/ab/cd/one.mp3')
+    assert cached.local_path('blobs/ab/cd/one.mp3') == path
+    assert _read(path) == b'first'  # served from disk, no second download
+
+
+def test_missing_key(cached):
+    path = cached.local_path('blobs/ab/cd/missing.mp3')
+    assert not os.path.exists(path)
+    assert not cached.exists('blobs/ab/cd/missing.mp3')
+    assert cached.version('blobs/ab/cd/missing.mp3') is None
+    assert os.listdir(cached.temp_dir()) == []  # no partial download left behind
+
+
+def test_exists_and_version_do_not_download(remote, cached):
+    _put_remote(remote, 'songs/legacy.mp3', b'v1')
+    assert cached.exists('songs/legacy.mp3')
+    version = cached.version('songs/legacy.mp3')
+    assert not os.path.exists(cached._cache_path('songs/legacy.mp3'))
+
+    _put_remote(remote, 'songs/legacy.mp3', b'v2 longer')
+    assert cached.version('songs/legacy.mp3') not in (None, version)
+
+
+def test_put_file_uploads_and_keeps_a_cached_copy(remote, cached):
+    source = _scratch_file(cached, b'uploaded')
+    cached.put_file(source, 'blobs/ef/01/two.mp3')
+
+    assert not os.path.exists(source)
+    assert _read(cached._cache_path('blobs/ef/01/two.mp3')) == b'uploaded'
+    body = remote.client.get_object(Bucket=BUCKET, Key='audio/blobs/ef/01/two.mp3')['Body'].read()
+    assert body == b'uploaded'
+    assert [key for key, _, _ in remote.iter_files('blobs/')] == ['blobs/ef/01/two.mp3']
+
+
+def test_eviction_drops_least_recently_used_first(remote, cached):
+    paths = {}
+    for age, name in enumerate(('old', 'middle', 'new')):
+        _put_remote(remote, f'blobs/{name}.mp3', b'x' * 100)
+        paths[name] = cached.local_path(f'blobs/{name}.mp3')
+        stamp = 1_000_000 + age
+        os.utime(paths[name], (stamp, stamp))
+
+    cached.max_bytes = 250
+    cached.evict()
+
+    assert not os.path.exists(paths['old'])
+    assert os.path.exists(paths['middle']) and os.path.exists(paths['new'])
+
+
+def test_hit_counts_as_recent_use(remote, cached):
+    paths = {}
+    for age, name in enumerate(('old', 'middle', 'new')):
+        _put_remote(remote, f'blobs/{name}.mp3', b'x' * 100)
+        paths[name] = cached.local_path(f'blobs/{name}.mp3')
+        stamp = 1_000_000 + age
+        os.utime(paths[name], (stamp, stamp))
+
+    cached.local_path('blobs/old.mp3')
+    cached.max_bytes = 250
+    cached.evict()
+
+    assert os.path.exists(paths['old'])
+    assert not os.path.exists(paths['middle'])
+
+
+def test_eviction_keeps_the_file_being_served(remote, cached):
+    paths = {}
+    for age, name in enumerate(('old', 'middle', 'new')):
+        _put_remote(remote, f'blobs/{name}.mp3', b'x' * 100)
+        paths[name] = cached.local_path(f'blobs/{name}.mp3')
+        stamp = 1_000_000 + age
+        os.utime(paths[name], (stamp, stamp))
+
+    cached.max_bytes = 150
+    cached.evict(keep=paths['old'])
+
+    assert os.path.exists(paths['old'])
+    assert not os.path.exists(paths['middle']) and not os.path.exists(paths['new'])
+
+
+def test_reads_stay_under_the_cap(remote, cached):
+    cached.max_bytes = 300
+    for i in range(10):
+        _put_remote(remote, f'blobs/{i}.mp3', b'x' * 100)
+        assert _read(cached.local_path(f'blobs/{i}.mp3')) == b'x' * 100
+        total = sum(size for size in _cached_sizes(cached))
+        assert total <= 300
+
+
+def _cached_sizes(cached):
+    for dirpath, _, filenames in os.walk(os.path.join(cached.directory, 'files')):
+        for name in filenames:
+            yield os.path.getsize(os.path.join(dirpath, name))
+
+
+def test_local_version_changes_when_the_file_is_replaced(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    assert storage.version('songs/a.mp3') is None
+    storage.put_file(_scratch_file(storage, b'one'), 'songs/a.mp3')
+    first = storage.version('songs/a.mp3')
+    storage.put_file(_scratch_file(storage, b'second'), 'songs/a.mp3')
+    assert storage.version('songs/a.mp3') != first
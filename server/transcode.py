@@ -0,0 +1,108 @@
+"""Bitrate renditions of song audio.
+
+Whenever a song's audio is uploaded or a lesson is built, a ``transcode``
+job re-encodes it at each of AUDIO_RENDITIONS in the job worker's process
+pool. Renditions live in the blob store like any other audio and are
+recorded as AudioRendition rows; get_song_audio serves the one a client
+asks for. Each rendition remembers the audio_file it was made from, so a
+song whose audio has changed since falls back to the original until the
+next transcode finishes.
+"""
+import os
+
+from flask import current_app
+
+from server.models import db, Song, AudioRendition
+from server.audio_pipeline import transcode_file
+from server import blob_store
+
+RENDITION_FORMAT = 'mp3'
+
+
+class TranscodeError(Exception):
+    """Raised when a song cannot be transcoded"""
+
+
+def parse_bitrate(value):
+    """'64k' -> 64000"""
+    value = str(value).strip().lower()
+    if value.endswith('k'):
+        return int(float(value[:-1]) * 1000)
+    return int(value)
+
+
+def _source_bitrate(path):
+    from pydub.utils import mediainfo
+    try:
+        return int(mediainfo(path).get('bit_rate') or 0) or None
+    except (ValueError, OSError):
+        return None
+
+
+def transcode_song(song_id, progress=None):
+    """Bring the song's renditions in line with its audio and AUDIO_RENDITIONS.
+
+    Renditions that are already current are kept. Ones that would not be
+    smaller than the source are skipped, since the original serves them.
+    """
+    song = db.session.get(Song, song_id)
+    if song is None:
+        raise TranscodeError(f"Song {song_id} not found")
+
+    source = song.audio_file
+    source_path = blob_store.resolve_audio_path('songs', source)
+    if not os.path.exists(source_path):
+        raise TranscodeError(f"Missing file: {source}")
+    source_bitrate = _source_bitrate(source_path)
+
+    wanted = current_app.config['AUDIO_RENDITIONS']
+    existing = {r.quality: r for r in AudioRendition.query.filter_by(song_id=song_id)}
+
+    for index, (quality, bitrate) in enumerate(wanted.items(), start=1):
+        rate = parse_bitrate(bitrate)
+        current = existing.pop(quality, None)
+
+        if source_bitrate and rate >= source_bitrate:
+            if current:
+                _drop(current)
+        elif not (current and current.source == source and current.bitrate == rate):
+            tmp_path = blob_store.temp_path(f'.{RENDITION_FORMAT}')
+            try:
+                transcode_file(source_path, tmp_path, format=RENDITION_FORMAT, bitrate=bitrate)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            size = os.path.getsize(tmp_path)
+            audio_key = blob_store.ingest_file(tmp_path, RENDITION_FORMAT)
+
+            if current:
+                blob_store.replace_ref(current.audio_file, audio_key)
+            else:
+                blob_store.add_ref(audio_key)
+                current = AudioRendition(song_id=song_id, quality=quality)
+                db.session.add(current)
+            current.source = source
+            current.audio_file = audio_key
+            current.format = RENDITION_FORMAT
+            current.bitrate = rate
+            current.size = size
+
+        db.session.commit()  # keep finished renditions if a later one fails
+        if progress:
+            progress(index, len(wanted))
+
+    # Qualities that were removed from AUDIO_RENDITIONS
+    for rendition in existing.values():
+        _drop(rendition)
+    db.session.commit()
+
+
+def _drop(rendition):
+    blob_store.release(rendition.audio_file)
+    db.session.delete(rendition)
+
+
+def current_rendition(song, quality):
+    """The song's rendition at ``quality`` if it was made from its current audio"""
+    return AudioRendition.query.filter_by(song_id=song.id, quality=quality, source=song.audio_file).first()
@@ -0,0 +1,147 @@
+"""Upload throughput: multipart song upload against chunked resumable upload.
+
+    python -m server.upload_benchmark [--size-mb 100] [--chunk-mb 8] [--runs 3]
+
+Uploads a file of random bytes (new content every run, so nothing is
+deduplicated) through the Flask test client, into a fresh SQLite database
+and blob store under a temp directory:
+
+``multipart``  POST /api/playlists/<id>/songs with the file as form data
+``chunked``    POST .../uploads, ``--chunk-mb`` PUTs read from the file,
+               then commit with the sha256 to verify
+
+Reports MiB/s and the peak Python memory allocated while uploading
+(tracemalloc, in a separate pass since tracing slows things down).
+"""
+import argparse
+import hashlib
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+MODES = ('multipart', 'chunked')
+MIB = 1024 * 1024
+
+
+def make_file(path, size):
+    with open(path, 'wb') as f:
+        for _ in range(size // MIB):
+            f.write(os.urandom(MIB))
+        f.write(os.urandom(size % MIB))
+
+
+class FileWindow(io.RawIOBase):
+    """``length`` bytes of a file from ``offset``, as a seekable stream the test client can send"""
+
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.offset = offset
+        self.length = length
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = max(0, min(base + position, self.length))
+        return self.position
+
+    def readinto(self, buffer):
+        self.f.seek(self.offset + self.position)
+        size = self.f.readinto(memoryview(buffer)[:self.length - self.position])
+        self.position += size
+        return size
+
+
+def upload_multipart(client, playlist_id, path):
+    with open(path, 'rb') as f:
+        response = client.post(f'/api/playlists/{playlist_id}/songs', content_type='multipart/form-data',
+                               data={'title': 't', 'artist': 'a', 'audio': (f, 'song.mp3')})
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def upload_chunked(client, playlist_id, path, chunk_size):
+    size = os.path.getsize(path)
+    response = client.post(f'/api/playlists/{playlist_id}/uploads',
+                           json={'title': 't', 'artist': 'a', 'filename': 'song.mp3', 'size': size})
+    upload_id = response.json['id']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MIB), b''):
+            digest.update(chunk)  # what a client computes before committing
+        for offset in range(0, size, chunk_size):
+            length = min(chunk_size, size - offset)
+            response = client.put(f'/api/uploads/{upload_id}', input_stream=FileWindow(f, offset, length),
+                                  headers={'Content-Range': f'bytes {offset}-{offset + length - 1}/{size}'})
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+    response = client.post(f'/api/uploads/{upload_id}/commit', json={'sha256': digest.hexdigest()})
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def measure(app, mode, directory, size, chunk_size, runs, trace=False):
+    """Seconds per run, or peak traced bytes per run with ``trace``"""
+    from server.models import db, Playlist
+
+    with app.app_context():
+        playlist_id = db.session.scalar(db.select(Playlist.id).order_by(Playlist.id))
+    client = app.test_client()
+    results = []
+    for _ in range(runs):
+        path = os.path.join(directory, 'upload.bin')
+        make_file(path, size)
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        if mode == 'multipart':
+            upload_multipart(client, playlist_id, path)
+        else:
+            upload_chunked(client, playlist_id, path, chunk_size)
+        elapsed = time.perf_counter() - started
+        if trace:
+            results.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        else:
+            results.append(elapsed)
+        os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=100)
+    parser.add_argument('--chunk-mb', type=float, default=8)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    size = int(args.size_mb * MIB)
+    chunk_size = int(args.chunk_mb * MIB)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(directory, 'uploads.db')}")
+        os.environ.setdefault('AUDIO_STORAGE_ROOT', os.path.join(directory, 'audio'))
+        from server.app import create_app
+
+        app = create_app('testing')
+        app.config['UPLOAD_CHUNK_MAX_BYTES'] = max(app.config['UPLOAD_CHUNK_MAX_BYTES'], chunk_size)
+        print(f"{args.size_mb:g} MiB file, {args.chunk_mb:g} MiB chunks, {args.runs} runs")
+        for mode in MODES:
+            seconds = measure(app, mode, directory, size, chunk_size, args.runs)
+            peak = measure(app, mode, directory, size, chunk_size, 1, trace=True)[0]
+            median = statistics.median(seconds)
+            print(f"  {mode:9}  median {median:5.2f} s  {size / MIB / median:6.0f} MiB/s  "
+                  f"peak Python memory {peak / MIB:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""Resumable, chunked song uploads.
+
+1. ``POST /api/playlists/<id>/uploads`` with JSON ``{title, artist,
+   filename, size?}`` opens an upload and returns its id.
+2. ``PUT /api/uploads/<upload_id>`` sends the next chunk as the raw request
+   body. The chunk offset goes in ``Content-Range: bytes <start>-<end>/<total>``
+   or ``?offset=``. Chunks must arrive in order; a mismatched offset gets a
+   409 carrying the offset the server expects, which is also what
+   ``GET /api/uploads/<upload_id>`` reports when resuming.
+3. ``POST /api/uploads/<upload_id>/commit``, optionally with ``{sha256}``,
+   creates the Song.
+
+Each chunk is read straight off the WSGI input into a scratch file and
+hashed on the way in. Only once the request has claimed its offset (a
+conditional UPDATE of ``received``) is the chunk added to the upload's
+``.part`` file, so two requests racing for the same offset cannot mix
+their bytes; the loser's scratch file is dropped. A first chunk simply
+becomes the ``.part`` file. Committing hands it to the content-addressed
+store (a rename on local storage).
+
+Uploads left open for UPLOAD_EXPIRE_SECONDS are expired by gc-blobs,
+which also deletes their files.
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import update
+from werkzeug.utils import secure_filename
+
+from server.cache import TTLCache
+from server.models import db, Playlist, Song, SongUpload
+from server.playlist_routes import song_to_dict
+from server import blob_store
+from server.jobs import enqueue_job
+
+upload_bp = Blueprint('upload', __name__)
+
+READ_SIZE = 256 * 1024
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# Running SHA-256 per upload, so the hash is ready at commit time without
+# re-reading the file. Workers that did not see the earlier chunks (or
+# after the entry expired) rebuild it from the partial file.
+_hashers = TTLCache(maxsize=1024, ttl=3600)
+
+
+def _part_path(upload):
+    return os.path.join(blob_store.temp_dir(), f'{upload.filename}.part')
+
+
+def _upload_to_dict(upload):
+    return {
+        "id": upload.id,
+        "offset": upload.received,
+        "size": upload.size,
+        "status": upload.status,
+        "songId": upload.song_id
+    }
+
+
+def _hasher_at(upload, offset):
+    """SHA-256 of the first ``offset`` bytes, for this request to extend"""
+    state = _hashers.get(upload.id)
+    if state and state[0] == offset:
+        return state[1].copy()
+
+    hasher = hashlib.sha256()
+    with open(_part_path(upload), 'rb') as f:
+        remaining = offset
+        while remaining > 0:
+            chunk = f.read(min(READ_SIZE, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+@upload_bp.route('/api/playlists/<int:playlist_id>/uploads', methods=['POST'])
+def create_upload(playlist_id):
+    Playlist.query.get_or_404(playlist_id)
+
+    data = request.json
+    if not data or not data.get('title') or not data.get('artist') or not data.get('filename'):
+        return jsonify({"error": "Title, artist and filename are required"}), 400
+
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size <= 0):
+        return jsonify({"error": "size must be a positive integer"}), 400
+
+    upload_id = uuid.uuid4().hex
+    upload = SongUpload(
+        id=upload_id,
+        playlist_id=playlist_id,
+        title=data['title'],
+        artist=data['artist'],
+        filename=f"{upload_id}_{secure_filename(data['filename'])}",
+        size=size
+    )
+
+    os.makedirs(os.path.dirname(_part_path(upload)), exist_ok=True)
+    open(_part_path(upload), 'wb').close()
+
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(_upload_to_dict(upload)), 201
+
+
+@upload_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    upload = SongUpload.query.get_or_404(upload_id)
+    return jsonify(_upload_to_dict(upload))
+
+
+def _claim(upload_id, offset, new_offset, require_open=True):
+    """Move ``received`` from ``offset`` to ``new_offset``; False if another request got there first"""
+    criteria = [SongUpload.id == upload_id, SongUpload.received == offset]
+    if require_open:
+        criteria.append(SongUpload.status == 'open')  # not once a commit has claimed the upload
+    result = db.session.execute(
+        update(SongUpload)
+        .where(*criteria)
+        .values(received=new_offset, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def _set_status(upload_id, current, new):
+    """Move the upload from status ``current`` to ``new``; False if it was not in ``current``"""
+    result = db.session.execute(
+        update(SongUpload)
+        .where(SongUpload.id == upload_id, SongUpload.status == current)
+        .values(status=new, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def _append(chunk_path, part_path, offset):
+    if offset == 0:
+        os.replace(chunk_path, part_path)
+        return
+    with open(chunk_path, 'rb') as src, open(part_path, 'r+b') as dst:
+        dst.seek(offset)
+        shutil.copyfileobj(src, dst, READ_SIZE)
+    os.remove(chunk_path)
+
+
+@upload_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    upload = SongUpload.query.get_or_404(upload_id)
+    if upload.status != 'open':
+        return jsonify({"error": f"Upload is {upload.status}"}), 409
+
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = _CONTENT_RANGE.fullmatch(content_range.strip())
+        if not match:
+            return jsonify({"error": "Invalid Content-Range"}), 400
+        offset = int(match.group(1))
+    else:
+        offset = request.args.get('offset', upload.received, type=int)
+
+    if offset != upload.received:
+        return jsonify({"error": "Unexpected offset", "offset": upload.received}), 409
+
+    length = request.content_length
+    if length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+    if length > current_app.config['UPLOAD_CHUNK_MAX_BYTES']:
+        return jsonify({"error": "Chunk too large"}), 413
+    if upload.size is not None and offset + length > upload.size:
+        return jsonify({"error": "Chunk runs past the announced size"}), 400
+
+    part_path = _part_path(upload)
+    if os.path.getsize(part_path) < offset:
+        # The request that claimed the previous chunk is still writing it
+        return jsonify({"error": "Previous chunk is still being written", "offset": offset}), 409
+
+    hasher = _hasher_at(upload, offset)
+    chunk_path = blob_store.temp_path(suffix='.chunk')
+    written = 0
+    try:
+        with open(chunk_path, 'wb') as f:
+            while written < length:
+                chunk = request.stream.read(min(READ_SIZE, length - written))
+                if not chunk:
+                    break
+                f.write(chunk)
+                hasher.update(chunk)
+                written += len(chunk)
+
+        # Only the request that moves the offset on may write at it
+        if not _claim(upload_id, offset, offset + written):
+            db.session.refresh(upload)
+            return jsonify({"error": "Concurrent upload detected", "offset": upload.received}), 409
+        try:
+            _append(chunk_path, part_path, offset)
+        except BaseException:
+            with open(part_path, 'r+b') as f:
+                f.truncate(offset)
+            _claim(upload_id, offset + written, offset, require_open=False)
+            raise
+    finally:
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+
+    _hashers.set(upload_id, (offset + written, hasher))
+    return jsonify({"id": upload_id, "offset": offset + written}), 200
+
+
+@upload_bp.route('/api/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    upload = SongUpload.query.get_or_404(upload_id)
+    if upload.status != 'open':
+        return jsonify({"error": f"Upload is {upload.status}"}), 409
+    if upload.received == 0:
+        return jsonify({"error": "No data uploaded"}), 400
+    if upload.size is not None and upload.received != upload.size:
+        return jsonify({"error": "Upload is incomplete", "offset": upload.received}), 409
+
+    # Claim the commit, so a retried request cannot ingest the same .part
+    # file a second time; chunks are refused from here on too
+    if not _set_status(upload_id, 'open', 'committing'):
+        db.session.refresh(upload)
+        return jsonify({"error": f"Upload is {upload.status}"}), 409
+    try:
+        response = _commit_claimed(upload)
+    except Exception:
+        db.session.rollback()
+        _set_status(upload_id, 'committing', 'open')
+        raise
+    if response[1] != 201:
+        _set_status(upload_id, 'committing', 'open')
+    return response
+
+
+def _commit_claimed(upload):
+    part_size = os.path.getsize(_part_path(upload))
+    if part_size < upload.received:
+        return jsonify({"error": "Last chunk is still being written", "offset": upload.received}), 409
+    if part_size > upload.received:
+        with open(_part_path(upload), 'r+b') as f:
+            f.truncate(upload.received)  # left by a chunk whose claim was rolled back
+
+    digest = _hasher_at(upload, upload.received).hexdigest()
+    _hashers.pop(upload.id)
+    expected = (request.get_json(silent=True) or {}).get('sha256')
+    if expected and expected.lower() != digest:
+        return jsonify({"error": "Checksum mismatch", "sha256": digest}), 400
+
+    # Same volume, so this is a rename rather than a copy
+    audio_key = blob_store.ingest_file(_part_path(upload), blob_store.file_extension(upload.filename),
+                                       sha256=digest)
+
+    song = Song(
+        title=upload.title,
+        artist=upload.artist,
+        playlist_id=upload.playlist_id,
+        audio_file=audio_key
+    )
+    blob_store.add_ref(audio_key)
+    db.session.add(song)
+    db.session.flush()
+
+    upload.status = 'committed'
+    upload.sha256 = digest
+    upload.song_id = song.id
+    upload.updated_at = datetime.utcnow()
+    db.session.commit()
+    enqueue_job('transcode', song.id)
+    enqueue_job('analyze_song', song.id)
+
+    return jsonify(song_to_dict(song)), 201
@@ -42,5 +42,6 @@ export const insertPlayHistorySchema = createInsertSchema(playHistory);
 export type InsertUser = z.infer<typeof insertUserSchema>;
 export type User = typeof users.$inferSelect;
 export type Playlist = typeof playlists.$inferSelect;
-export type Song = typeof songs.$inferSelect;
+// As the API returns songs: audioUrl is versioned by content, so browsers can cache it
+export type Song = typeof songs.$inferSelect & { audioUrl: string };
 export type PlayHistory = typeof playHistory.$inferSelect;